@@ -0,0 +1,281 @@
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import des_simulator
+from des_simulator import (DES_Simulator, Batch_DES_Simulator, Convolution_Projector, Input_Census,
+                           sensitivity_calculation, arrival_fitting, rolling_doubling_time,
+                           COL_CUM_COVID_ADMISSION)
+
+'''
+Benchmarks of the simulation entry points over horizons, scenario counts, cohort counts and input census lengths
+    python benchmark.py run --output baseline.json
+    python benchmark.py run --output current.json --horizons 10 100 --scenarios 1 10
+    python benchmark.py compare baseline.json current.json --threshold 0.1
+each case records the best wall time of --repeat runs, and the peak traced memory and
+the blocks still allocated after one more run under tracemalloc
+'''
+
+DEFAULT_HORIZONS = [10, 100, 1000, 10000]
+DEFAULT_SCENARIOS = [1, 100]
+DEFAULT_COHORTS = [5, 20]
+DEFAULT_INPUT_DAYS = [1, 30]
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.1
+# cases faster than this are too noisy to flag as regressions
+DEFAULT_MIN_SECONDS = 1e-3
+
+# case dimensions, in the order of the baseline keys
+CASE_KEYS = ['entry_point', 'n_days', 'n_scenarios', 'n_cohorts', 'n_input_days']
+# value of a dimension an entry point does not depend on
+CASE_DEFAULTS = {'n_days': des_simulator.MAX_SIMULATION_DAYS, 'n_scenarios': 1, 'n_cohorts': 5, 'n_input_days': 1}
+
+STARTING_TOTAL = 11
+DOUBLING_TIME = 6.2
+# capacities never reached, so that run_till_cap always runs the whole horizon
+NO_CAPACITY = [np.inf, np.inf, np.inf, 0.5]
+
+
+def _cohorts(n_cohorts, seed = 0):
+    '''
+    cohort_fraction [cohort] and los_matrix [cohort, stay]: the five default cohorts,
+    then random paths for any further cohort, the same for a given seed
+    '''
+    cohort_fraction = [0.704, 0.13, 0.018, 0.13, 0.018][:n_cohorts]
+    los_matrix = [[5, 0, 0], [4, 9, 4], [6, 9, 0], [0, 9, 4], [0, 11, 0]][:n_cohorts]
+    rng = np.random.default_rng(seed)
+    for _ in range(n_cohorts - len(los_matrix)):
+        los = rng.integers(0, 12, size = 3) * (rng.random(3) < 0.7)
+        los[rng.integers(0, 3)] = rng.integers(1, 12)
+        cohort_fraction.append(rng.random() * 0.05)
+        los_matrix.append(list(los))
+    cohort_fraction = list(np.array(cohort_fraction) / np.sum(cohort_fraction))
+    return cohort_fraction, los_matrix
+
+
+def _input_census(n_input_days):
+    # observed census growing from one covid patient per unit
+    days = np.arange(n_input_days)
+    covid = 2 ** (days / DOUBLING_TIME)
+    return Input_Census(days, covid, np.full(n_input_days, 67.), 1.5 * covid, np.full(n_input_days, 86.))
+
+
+def _doubling_time(n_days):
+    # long horizons grow slower, admissions would overflow float after about 1000 doubling times
+    return max(DOUBLING_TIME, n_days / 500.)
+
+
+def _simulator(simulator_class, n_days, n_scenarios, n_cohorts, n_input_days):
+    cohort_fraction, los_matrix = _cohorts(n_cohorts)
+    if simulator_class is DES_Simulator:
+        simulator = DES_Simulator(n_days, STARTING_TOTAL, _doubling_time(n_days), cohort_fraction, los_matrix)
+    else:
+        # scenarios differ by their doubling time
+        doubling_time = _doubling_time(n_days) * np.linspace(1, 2, n_scenarios)
+        simulator = simulator_class(n_days, STARTING_TOTAL, doubling_time, cohort_fraction, los_matrix)
+    simulator.state_init(1, 1, 67, 86, _input_census(n_input_days))
+    return simulator
+
+
+def _run(simulator_class):
+    def setup(n_days, n_scenarios, n_cohorts, n_input_days):
+        simulator = _simulator(simulator_class, n_days, n_scenarios, n_cohorts, n_input_days)
+        return simulator.run
+    return setup
+
+
+def _run_till_cap(simulator_class):
+    def setup(n_days, n_scenarios, n_cohorts, n_input_days):
+        simulator = _simulator(simulator_class, n_days, n_scenarios, n_cohorts, n_input_days)
+        return lambda: simulator.run_till_cap(*NO_CAPACITY)
+    return setup
+
+
+def _sensitivity(los_method):
+    def setup(n_days, n_scenarios, n_cohorts, n_input_days):
+        input_census = _input_census(n_input_days)
+        return lambda: sensitivity_calculation(input_census, los_method = los_method, use_cache = False)
+    return setup
+
+
+def _cum_admissions(n_input_days):
+    return np.cumsum(STARTING_TOTAL * 2 ** (np.arange(n_input_days) / DOUBLING_TIME))
+
+
+def _arrival_fitting(n_days, n_scenarios, n_cohorts, n_input_days):
+    import pandas as pd
+    df_new = pd.DataFrame({COL_CUM_COVID_ADMISSION: _cum_admissions(n_input_days)})
+    return lambda: arrival_fitting(df_new)
+
+
+def _rolling_doubling_time(n_days, n_scenarios, n_cohorts, n_input_days):
+    # one series per scenario
+    cum_admissions = np.tile(_cum_admissions(n_input_days), [n_scenarios, 1])
+    return lambda: rolling_doubling_time(cum_admissions)
+
+
+# entry point -> (setup returning the function to time, case dimensions it depends on)
+ENTRY_POINTS = dict([('DES_Simulator.run', (_run(DES_Simulator), ['n_days', 'n_cohorts', 'n_input_days'])),
+                     ('DES_Simulator.run_till_cap', (_run_till_cap(DES_Simulator), ['n_days', 'n_cohorts', 'n_input_days'])),
+                     ('Batch_DES_Simulator.run', (_run(Batch_DES_Simulator), ['n_days', 'n_scenarios', 'n_cohorts', 'n_input_days'])),
+                     ('Batch_DES_Simulator.run_till_cap', (_run_till_cap(Batch_DES_Simulator), ['n_days', 'n_scenarios', 'n_cohorts', 'n_input_days'])),
+                     ('Convolution_Projector.run', (_run(Convolution_Projector), ['n_days', 'n_scenarios', 'n_cohorts', 'n_input_days'])),
+                     ('sensitivity_calculation', (_sensitivity('discrete'), ['n_input_days'])),
+                     ('sensitivity_calculation.analytic', (_sensitivity('analytic'), ['n_input_days'])),
+                     ('arrival_fitting', (_arrival_fitting, ['n_input_days'])),
+                     ('rolling_doubling_time', (_rolling_doubling_time, ['n_scenarios', 'n_input_days']))])
+
+
+def benchmark_cases(horizons, scenarios, cohorts, input_days, entry_points = None):
+    '''
+    every distinct case of the entry points, dimensions an entry point does not depend on are None
+    '''
+    axes = {'n_days': horizons, 'n_scenarios': scenarios, 'n_cohorts': cohorts, 'n_input_days': input_days}
+    cases = []
+    for entry_point in (entry_points or ENTRY_POINTS):
+        if entry_point not in ENTRY_POINTS:
+            raise ValueError('unknown entry point: ' + str(entry_point))
+        dimensions = ENTRY_POINTS[entry_point][1]
+        for values in itertools.product(*[axes[key] if key in dimensions else [None] for key in CASE_KEYS[1:]]):
+            cases.append(dict(zip(CASE_KEYS, [entry_point] + list(values))))
+    return cases
+
+
+def measure(setup, repeat = DEFAULT_REPEAT):
+    '''
+    best wall time over repeat fresh runs, then peak traced memory of one traced run and the blocks
+    it leaves allocated; these are blocks still alive after the run, not a count of its allocations
+    setup builds the function to time, so that it is not part of the measure
+    '''
+    seconds = np.inf
+    for _ in range(repeat):
+        func = setup()
+        start = time.perf_counter()
+        func()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    func = setup()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    func()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks_still_allocated = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return {'seconds': seconds, 'peak_bytes': int(peak_bytes), 'blocks_still_allocated': int(blocks_still_allocated)}
+
+
+def run_benchmarks(horizons = DEFAULT_HORIZONS, scenarios = DEFAULT_SCENARIOS,
+                   cohorts = DEFAULT_COHORTS, input_days = DEFAULT_INPUT_DAYS,
+                   entry_points = None, repeat = DEFAULT_REPEAT, verbose = False):
+    '''
+    Output: machine-readable baseline, the environment and one result per case
+    '''
+    results = []
+    # fits of one or two observed days are degenerate, their warnings are expected
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        for case in benchmark_cases(horizons, scenarios, cohorts, input_days, entry_points):
+            setup, _ = ENTRY_POINTS[case['entry_point']]
+            arguments = [case[key] if case[key] is not None else CASE_DEFAULTS[key] for key in CASE_KEYS[1:]]
+            result = dict(case, **measure(lambda: setup(*arguments), repeat))
+            if verbose:
+                print(_format_case(case), '%.6f s' % result['seconds'], '%d bytes' % result['peak_bytes'])
+            results.append(result)
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+            'results': results}
+
+
+def _format_case(case):
+    return '%s %s' % (case['entry_point'],
+                      ' '.join('%s=%s' % (key, case[key]) for key in CASE_KEYS[1:] if case[key] is not None))
+
+
+def compare_benchmarks(baseline, current, threshold = DEFAULT_THRESHOLD, min_seconds = DEFAULT_MIN_SECONDS):
+    '''
+    ratio current / baseline of the time and peak memory of every case in both runs
+    a case regresses when a ratio exceeds 1 + threshold (time only when the baseline takes min_seconds or more)
+    Output: list of dicts with the case, both measures, the ratios and a regression flag
+    '''
+    baseline_results = dict((tuple(result[key] for key in CASE_KEYS), result) for result in baseline['results'])
+    comparison = []
+    for result in current['results']:
+        case = tuple(result[key] for key in CASE_KEYS)
+        if case not in baseline_results:
+            continue
+        base = baseline_results[case]
+        time_ratio = result['seconds'] / base['seconds'] if base['seconds'] > 0 else np.inf
+        memory_ratio = result['peak_bytes'] / base['peak_bytes'] if base['peak_bytes'] > 0 else np.inf
+        regression = []
+        if time_ratio > 1 + threshold and base['seconds'] >= min_seconds:
+            regression.append('time')
+        if memory_ratio > 1 + threshold:
+            regression.append('memory')
+        comparison.append(dict(zip(CASE_KEYS, case),
+                               baseline_seconds = base['seconds'], seconds = result['seconds'], time_ratio = time_ratio,
+                               baseline_peak_bytes = base['peak_bytes'], peak_bytes = result['peak_bytes'],
+                               memory_ratio = memory_ratio, regression = regression))
+    return comparison
+
+
+def _report(comparison):
+    lines = []
+    for row in comparison:
+        lines.append('%-8s %-70s time %10.6f -> %10.6f s (x%.2f)  peak %10d -> %10d B (x%.2f)'
+                     % (','.join(row['regression']) or 'ok', _format_case(row),
+                        row['baseline_seconds'], row['seconds'], row['time_ratio'],
+                        row['baseline_peak_bytes'], row['peak_bytes'], row['memory_ratio']))
+    n_regressions = sum(1 for row in comparison if row['regression'])
+    lines.append('%d of %d cases regressed' % (n_regressions, len(comparison)))
+    return '\n'.join(lines)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'benchmarks of the simulation entry points')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+
+    run_parser = commands.add_parser('run', help = 'measure every case and save the results as json')
+    run_parser.add_argument('--output', default = 'benchmark.json')
+    run_parser.add_argument('--horizons', type = int, nargs = '+', default = DEFAULT_HORIZONS)
+    run_parser.add_argument('--scenarios', type = int, nargs = '+', default = DEFAULT_SCENARIOS)
+    run_parser.add_argument('--cohorts', type = int, nargs = '+', default = DEFAULT_COHORTS)
+    run_parser.add_argument('--input-days', type = int, nargs = '+', default = DEFAULT_INPUT_DAYS)
+    run_parser.add_argument('--entry-points', nargs = '+', choices = list(ENTRY_POINTS))
+    run_parser.add_argument('--repeat', type = int, default = DEFAULT_REPEAT)
+
+    compare_parser = commands.add_parser('compare', help = 'flag the cases of a run that regressed from a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type = float, default = DEFAULT_THRESHOLD)
+    compare_parser.add_argument('--min-seconds', type = float, default = DEFAULT_MIN_SECONDS)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        results = run_benchmarks(args.horizons, args.scenarios, args.cohorts, args.input_days,
+                                 args.entry_points, args.repeat, verbose = True)
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent = 1)
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    comparison = compare_benchmarks(baseline, current, args.threshold, args.min_seconds)
+    print(_report(comparison))
+    return 1 if any(row['regression'] for row in comparison) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import itertools
+
+import numpy as np
+
+from des_simulator import (_input_census_arrays, _check_census_days, _initial_tracker,
+                           _cohort_occupancy, _admission_kernels, _causal_convolve)
+
+'''
+Calibration of doubling_time and starting_total (and optionally the cohort fractions) to an observed census
+the simulation starts from the first observed day; the covid census of the following days is the decay of
+that starting census plus starting_total times the admissions per starting patient convolved with the
+occupancy kernels of the cohorts, so for a doubling time starting_total is a closed form least squares,
+and many doubling times are evaluated as one batch of convolutions
+'''
+
+DOUBLING_TIME_BOUNDS = (1., 100.)
+
+
+class Census_Calibrator():
+    '''
+    Least squares fit of the icu and floor covid census for fixed los
+    the occupancy kernels of the los are computed once and shared by every fit
+    '''
+    def __init__(self, cohort_fraction = [0.704, 0.13, 0.018, 0.13, 0.018],
+                    los_matrix = [[5, 0, 0],
+                                  [4, 9, 4],
+                                  [6, 9, 0],
+                                  [0, 9, 4],
+                                  [0, 11, 0]]):
+        self.cohort_fraction = np.array(cohort_fraction, dtype = float)
+        self.los = np.array(los_matrix, dtype = int)[np.newaxis]
+        # [cohort, day since admission]
+        icu_kernel, floor_kernel = _admission_kernels(self.los)
+        self.kernels = np.concatenate([icu_kernel[0], floor_kernel[0]])
+
+    def _census_arrays(self, input_census):
+        # observed covid census [unit (icu, floor), day] and its decay from the first day [unit, day]
+        days, icu_covid, _, floor_covid, _ = _input_census_arrays(input_census)
+        _check_census_days(days)
+        observed = np.stack([icu_covid, floor_covid])
+        n_days = observed.shape[1]
+        tracker = _initial_tracker(self.los, self.cohort_fraction[np.newaxis], icu_covid[:1], floor_covid[:1],
+                                   np.max(self.los) + 1)
+        icu_decay, floor_decay = _cohort_occupancy(self.los, tracker, n_days - 1)
+        decay = np.stack([np.sum(icu_decay[0], axis = 0), np.sum(floor_decay[0], axis = 0)])
+        return observed[:, 1:], decay
+
+    def admitted_census(self, doubling_time, n_days):
+        '''
+        census of the patients admitted from day 1 on for a starting_total of 1,
+        [doubling time, cohort, unit (icu, floor), day] for the days 1 to n_days
+        '''
+        doubling_time = np.asarray(doubling_time, dtype = float).reshape(-1, 1)
+        days = np.arange(1, n_days + 1)
+        admissions = 2**((days - 1)/doubling_time) * (2**(1/doubling_time)-1)
+        n_candidates, n_cohorts = len(doubling_time), self.kernels.shape[0] // 2
+        signal = np.repeat(admissions, 2 * n_cohorts, axis = 0)
+        kernels = np.tile(self.kernels, (n_candidates, 1))
+        growth = np.repeat(2**(1/doubling_time.ravel()), 2 * n_cohorts)
+        census = _causal_convolve(signal, kernels, growth, 'direct')
+        return census.reshape(n_candidates, 2, n_cohorts, n_days).transpose(0, 2, 1, 3)
+
+    def _fit_candidates(self, doubling_time, residual, fit_fractions):
+        '''
+        best coefficients of each doubling time, the starting_total of every cohort, and their squared error
+        residual: observed minus decay, [unit, day]
+        returns (coefficients [doubling time, cohort], sse [doubling time])
+        '''
+        admitted = self.admitted_census(doubling_time, residual.shape[1])
+        n_candidates, n_cohorts = admitted.shape[:2]
+        target = residual.ravel()
+        if not fit_fractions:
+            design = np.einsum('c,dcut->dut', self.cohort_fraction, admitted).reshape(n_candidates, -1)
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                total = np.maximum(design @ target / np.sum(design**2, axis = 1), 0)
+            total = np.nan_to_num(total)
+            sse = np.sum((target - total[:, np.newaxis] * design)**2, axis = 1)
+            return total[:, np.newaxis] * self.cohort_fraction, sse
+
+        # non negative least squares over the cohorts: the best unconstrained fit
+        # of every subset of cohorts, among those with no negative coefficient
+        design = admitted.reshape(n_candidates, n_cohorts, -1).transpose(0, 2, 1)
+        best_coefficients = np.zeros([n_candidates, n_cohorts])
+        best_sse = np.full(n_candidates, np.sum(target**2))
+        for size in range(1, n_cohorts + 1):
+            for subset in itertools.combinations(range(n_cohorts), size):
+                subset = list(subset)
+                coefficients = np.linalg.pinv(design[:, :, subset]) @ target
+                sse = np.sum((target - np.einsum('dtc,dc->dt', design[:, :, subset], coefficients))**2, axis = 1)
+                better = np.all(coefficients >= 0, axis = 1) & (sse < best_sse)
+                best_sse = np.where(better, sse, best_sse)
+                best_coefficients[np.ix_(better, subset)] = coefficients[better]
+                best_coefficients[np.ix_(better, [col for col in range(n_cohorts) if col not in subset])] = 0
+        return best_coefficients, best_sse
+
+    def fit(self, input_census, doubling_time_bounds = DOUBLING_TIME_BOUNDS,
+            n_grid = 64, tolerance = 0.01, fit_fractions = False):
+        '''
+        doubling_time, starting_total (and cohort fractions) minimizing the squared error of
+        the icu and floor covid census of the observed days after the first
+            input_census: dataframe or Input_Census of consecutive observed days
+            n_grid: doubling times evaluated per batch, first over doubling_time_bounds (evenly in log),
+                    then around the best one until they are tolerance apart
+            fit_fractions: also fit the fractions, by non negative least squares over the cohorts;
+                           the starting census stays distributed by the given fractions
+        Output: dict with doubling_time, starting_total, cohort_fraction, sse, rmse and the number of
+                doubling times evaluated
+        '''
+        observed, decay = self._census_arrays(input_census)
+        if observed.shape[1] == 0:
+            raise ValueError('input census needs at least two observed days to calibrate')
+        residual = observed - decay
+
+        candidates = np.geomspace(doubling_time_bounds[0], doubling_time_bounds[1], n_grid)
+        n_evaluated = 0
+        while True:
+            coefficients, sse = self._fit_candidates(candidates, residual, fit_fractions)
+            n_evaluated += len(candidates)
+            best = np.argmin(sse)
+            low = candidates[max(best - 1, 0)]
+            high = candidates[min(best + 1, len(candidates) - 1)]
+            if high - low <= 2 * tolerance:
+                break
+            candidates = np.linspace(low, high, n_grid)
+
+        starting_total = np.sum(coefficients[best])
+        cohort_fraction = coefficients[best] / starting_total if starting_total > 0 else self.cohort_fraction
+        return {'doubling_time': candidates[best],
+                'starting_total': starting_total,
+                'cohort_fraction': cohort_fraction,
+                'sse': sse[best],
+                'rmse': np.sqrt(sse[best] / observed.size),
+                'n_evaluated': n_evaluated}
+
+
+def calibrate_census(input_census,
+                     cohort_fraction = [0.704, 0.13, 0.018, 0.13, 0.018],
+                     los_matrix = [[5, 0, 0],
+                                   [4, 9, 4],
+                                   [6, 9, 0],
+                                   [0, 9, 4],
+                                   [0, 11, 0]],
+                     doubling_time_bounds = DOUBLING_TIME_BOUNDS,
+                     fit_fractions = False):
+    # Census_Calibrator.fit of one census, keep a Census_Calibrator to fit many sites with the same los
+    return Census_Calibrator(cohort_fraction, los_matrix).fit(input_census, doubling_time_bounds,
+                                                             fit_fractions = fit_fractions)
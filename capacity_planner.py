@@ -0,0 +1,135 @@
+import collections
+
+import numpy as np
+
+from des_simulator import (MAX_SIMULATION_DAYS, SWEEP_DEFAULTS, CAP_DAYS_FIELDS,
+                           sweep_cap_days, scenario_parameters, scenario_simulator)
+
+'''
+Inverse questions of capacity planning, answered with a few batched simulations instead of a sweep
+    required_capacity: smallest capacity of a resource that is not exceeded before a target day, from one simulation
+    solve_threshold: threshold of any sweep parameter (doubling_time, starting_total, los_matrix_i_j, ...)
+                     keeping the cap days at a target day or later, by batched bisection
+cap days are monotonic in each of these parameters, so every batch narrows the bracket around the threshold
+days are numbered as in run_till_cap, from the first day of the input census
+'''
+
+RESOURCES = [field for field, _ in CAP_DAYS_FIELDS]
+
+# threshold of a parameter and how it was found
+Threshold = collections.namedtuple('Threshold', ['parameter', 'value', 'cap_days', 'n_simulations'])
+
+
+def _resource_days(records, resource):
+    # cap days of one resource, or the earliest of the three for resource 'all'
+    if resource == 'all':
+        return np.min(np.stack([records[field] for field in RESOURCES]), axis = 0)
+    if resource not in RESOURCES:
+        raise ValueError('unknown resource: ' + str(resource))
+    return records[resource]
+
+
+def required_capacity(resource, target_days,
+                      input_census = None,
+                      method = 'des',
+                      **base_parameters):
+    '''
+    Smallest whole capacity of resource ('icu', 'floor' or 'ventilator') that the demand does not exceed
+    before target_days, with the other parameters as in parameter_sweep
+    the first day over a capacity only moves later when the capacity grows, so one simulation
+    up to target_days answers it: the capacity is the largest demand of the projected days before target_days
+    Output: Threshold with the capacity, its cap days and 1 simulation
+    '''
+    if resource not in RESOURCES:
+        raise ValueError('unknown resource: ' + str(resource))
+    scenarios = scenario_parameters(**base_parameters)
+    simulator = scenario_simulator(scenarios, target_days, method, input_census)
+    simulator.run()
+
+    index = simulator.capacity_index()
+    demand = {'icu': index.icu_max,
+              'floor': index.floor_max,
+              'ventilator': np.maximum.accumulate(index.icu_covid + index.icu_noncovid * scenarios['icu_non_covid_ventilator_percentage'][0])}
+    demand = demand[resource][:max(target_days - index.start_day, 0)]
+    capacity = np.ceil(demand[-1]) if len(demand) > 0 else 0.
+    cap_days = {'icu': index.icu_cap_days,
+                'floor': index.floor_cap_days,
+                'ventilator': lambda cap: index.vent_cap_days(cap, scenarios['icu_non_covid_ventilator_percentage'][0])}
+    return Threshold(resource, capacity, int(cap_days[resource](capacity)), 1)
+
+
+def _ordered_values(start, stop, n_values, integer):
+    # n_values evenly spaced from start to stop, whole values without repeats when integer
+    values = np.linspace(start, stop, n_values)
+    if integer:
+        values = np.round(values).astype(int)
+        values = values[np.append(True, np.diff(values) != 0)]
+    return values
+
+
+def solve_threshold(parameter, target_days, bounds,
+                    resource = 'all',
+                    increasing = None,
+                    integer = None,
+                    tolerance = 0.01,
+                    batch_size = 8,
+                    input_census = None,
+                    n_days = MAX_SIMULATION_DAYS,
+                    method = 'des',
+                    **base_parameters):
+    '''
+    Threshold of parameter within bounds where the cap days of resource reach target_days
+        parameter: any name of SWEEP_DEFAULTS, the others take base_parameters or their defaults
+        resource: 'icu', 'floor', 'ventilator' or 'all' for the earliest of the three
+        increasing: whether larger values give later cap days (doubling_time, capacities) or earlier ones
+                    (starting_total, los), None to read it from the cap days at the two bounds
+        integer: search whole values only, by default for los_matrix_i_j
+        tolerance: width of the final bracket of a non-integer parameter
+    each round simulates batch_size values of the bracket as one batch and keeps the interval where
+    the target is first met, so the bracket shrinks by about batch_size + 1 per round
+    Output: Threshold with the last value that meets the target (the shortest doubling time, the longest los, ...),
+            None when no value within bounds meets it, its cap days and the number of simulated scenarios
+    '''
+    if parameter not in SWEEP_DEFAULTS:
+        raise ValueError('unknown sweep parameters: ' + str(parameter))
+    if integer is None:
+        integer = parameter.startswith('los_matrix_')
+
+    def resource_days(values):
+        records = sweep_cap_days(points = {parameter: values}, input_census = input_census,
+                                 n_days = n_days, chunk_size = len(values), method = method, **base_parameters)
+        return _resource_days(records, resource)
+
+    # the bounds and evenly spaced values between them
+    values = _ordered_values(bounds[0], bounds[1], batch_size, integer)
+    days = resource_days(values)
+    n_simulations = len(values)
+    if increasing is None:
+        increasing = days[-1] >= days[0]
+    if not increasing:
+        values, days = values[::-1], days[::-1]
+
+    # values run from the side missing the target to the side meeting it, where the threshold is the first meeting it
+    feasible = days >= target_days
+    if not np.any(feasible):
+        return Threshold(parameter, None, int(days[-1]), n_simulations)
+    ind = np.argmax(feasible)
+    if ind == 0:
+        return Threshold(parameter, values[0], int(days[0]), n_simulations)
+    best, best_days, other = values[ind], days[ind], values[ind - 1]
+
+    while abs(best - other) > (1 if integer else tolerance):
+        values = _ordered_values(other, best, batch_size + 2, integer)[1:-1]
+        if len(values) == 0:
+            break
+        days = resource_days(values)
+        n_simulations += len(values)
+        feasible = days >= target_days
+        if np.any(feasible):
+            ind = np.argmax(feasible)
+            best, best_days = values[ind], days[ind]
+            other = values[ind - 1] if ind > 0 else other
+        else:
+            other = values[-1]
+
+    return Threshold(parameter, best, int(best_days), n_simulations)
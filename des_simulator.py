@@ -1,11 +1,19 @@
-import pandas as pd
 import numpy as np
 import datetime
+import concurrent.futures
+import collections
+import functools
+import hashlib
+import inspect
+import json
+import marshal
+import os
+import pickle
+import time
 
 '''
 To do
  - initialze the model with csv from Sedj
- - random parameters (los)
 '''
 
 # column name
@@ -25,6 +33,7 @@ COL_VENTILATOR_CAP_DAYS = 'Ventilator_Cap_Days'
 COL_DOUBLING_TIME = 'Doubling_Time'
 COL_DAILY_NEW_COVID_ADMISSION = 'New COVID Admit'
 COL_CUM_COVID_ADMISSION = 'Total COVID Admit'
+COL_QUANTILE = 'Quantile'
 
 # input datafram columns
 INPUT_COL_DATE = 'Date'
@@ -33,6 +42,45 @@ INPUT_COL_ICU_NONCOVID = 'ICU_non_COVID_Census'
 INPUT_COL_FLOOR_COVID = 'Floor_COVID_Census'
 INPUT_COL_FLOOR_NONCOVID = 'Floor_non_COVID_Census'
 
+# structured arrays of the numpy core, field name -> dataframe column
+CENSUS_FIELDS = [('day', COL_DAY),
+                 ('icu_covid', COL_CENSUS_ICU_COVID), ('icu_noncovid', COL_CENSUS_ICU_NONCOVID),
+                 ('floor_covid', COL_CENSUS_FLOOR_COVID), ('floor_noncovid', COL_CENSUS_FLOOR_NONCOVID)]
+CENSUS_DTYPE = np.dtype([('day', np.int64)] + [(field, np.float64) for field, _ in CENSUS_FIELDS[1:]])
+CAP_DAYS_FIELDS = [('icu', COL_ICU_CAP_DAYS), ('floor', COL_FLOOR_CAP_DAYS), ('ventilator', COL_VENTILATOR_CAP_DAYS)]
+CAP_DAYS_DTYPE = np.dtype([(field, np.int64) for field, _ in CAP_DAYS_FIELDS])
+
+
+def _pandas():
+    # pandas is only imported once a dataframe is read or returned
+    import pandas
+    return pandas
+
+
+def census_records(icu_covid, icu_noncovid, floor_covid, floor_noncovid):
+    '''
+    census arrays [..., day] as one structured array of CENSUS_DTYPE, days numbered from 0
+    '''
+    census = np.empty(np.shape(icu_covid), dtype = CENSUS_DTYPE)
+    census['day'] = np.arange(census.shape[-1])
+    for (field, _), values in zip(CENSUS_FIELDS[1:], [icu_covid, icu_noncovid, floor_covid, floor_noncovid]):
+        census[field] = values
+    return census
+
+
+def cap_days_records(cap_days):
+    # cap days [..., icu/floor/ventilator] as a structured array of CAP_DAYS_DTYPE
+    cap_days = np.asarray(cap_days)
+    records = np.empty(cap_days.shape[:-1], dtype = CAP_DAYS_DTYPE)
+    for ind, (field, _) in enumerate(CAP_DAYS_FIELDS):
+        records[field] = cap_days[..., ind]
+    return records
+
+
+def records_frame(records, fields):
+    # dataframe of a 1-d structured array, with the column names of fields
+    return _pandas().DataFrame(dict((column, records[field]) for field, column in fields))
+
 # define the parametrized model input
 
 # define the patient characterstics
@@ -68,11 +116,99 @@ COHORT_PATHS = {0 : ['floor'],
                 }
 
 MAX_SIMULATION_DAYS = 100
+# horizons from this many projected days on are convolved by fft instead of directly
+FFT_CONVOLUTION_MIN_DAYS = 512
+
+# result cache of run_simulation and sensitivity_calculation
+CACHE_MAX_ENTRIES = 128
+CACHE_DIR = None # directory of the on-disk tier, None to keep results in memory only
+CACHE_TTL_SECONDS = 24 * 3600
+CACHE_MAX_DISK_BYTES = 256 * 2**20
 # MAX_REMAINING_LOS = 20
 STARTING_DAY = datetime.date(year = 2020, month = 3, day = 13)
 
 
 
+# phases of each simulated day, in loop order
+SIMULATION_PHASES = ['update_ch_tracker', 'admission', 'update_census']
+
+# state of the simulation after one day, arrays are read-only
+# census arrays up to the day, tracker [cohort, remaining los, stay] and the seconds of each phase
+Day_State = collections.namedtuple('Day_State', ['day', 'icu_covid_census', 'icu_noncovid_census',
+                                                 'floor_covid_census', 'floor_noncovid_census',
+                                                 'tracker', 'phase_seconds'])
+
+
+def _read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class Instrumentation():
+    '''
+    Observer of the DES_Simulator loop, set as simulator.instrumentation before run or run_till_cap
+    keeps the cumulative seconds and calls of each phase, a log record of every simulated day,
+    and calls each callback with the Day_State of every simulated day
+    '''
+    def __init__(self, callbacks = None, keep_log = True):
+        self.callbacks = list(callbacks or [])
+        self.keep_log = keep_log
+        self.seconds = dict((phase, 0.) for phase in SIMULATION_PHASES)
+        self.calls = dict((phase, 0) for phase in SIMULATION_PHASES)
+        self.log = []
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+        return None
+
+    def reset(self):
+        self.seconds = dict((phase, 0.) for phase in SIMULATION_PHASES)
+        self.calls = dict((phase, 0) for phase in SIMULATION_PHASES)
+        self.log = []
+        return None
+
+    def record_day(self, simulator, day, phase_seconds):
+        for phase, seconds in zip(SIMULATION_PHASES, phase_seconds):
+            self.seconds[phase] += seconds
+            self.calls[phase] += 1
+        census = [simulator.icu_covid_census, simulator.icu_noncovid_census,
+                  simulator.floor_covid_census, simulator.floor_noncovid_census]
+        if self.keep_log:
+            record = {'day': day}
+            record.update(zip(SIMULATION_PHASES, phase_seconds))
+            for (field, _), values in zip(CENSUS_FIELDS[1:], census):
+                record[field] = float(values[day])
+            self.log.append(record)
+        if self.callbacks:
+            state = Day_State(day, *[_read_only(values[:day + 1]) for values in census],
+                              tracker = _read_only(simulator.ch_tracker.to_array()[0]),
+                              phase_seconds = dict(zip(SIMULATION_PHASES, phase_seconds)))
+            for callback in self.callbacks:
+                callback(state)
+        return None
+
+    def save_log(self, file):
+        # one json record per simulated day, file is a path or a text file object
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, 'w') as log_file:
+                return self.save_log(log_file)
+        for record in self.log:
+            file.write(json.dumps(record) + '\n')
+        return None
+
+    def report(self):
+        # profile of the phases as text, slowest first
+        total = sum(self.seconds.values())
+        lines = ['%-20s %10s %12s %14s %7s' % ('phase', 'calls', 'seconds', 'us per call', 'share')]
+        for phase in sorted(SIMULATION_PHASES, key = lambda phase: -self.seconds[phase]):
+            seconds, calls = self.seconds[phase], self.calls[phase]
+            lines.append('%-20s %10d %12.6f %14.2f %6.1f%%'
+                         % (phase, calls, seconds, 1e6 * seconds / max(calls, 1), 100 * seconds / total if total > 0 else 0))
+        lines.append('%-20s %10s %12.6f' % ('total', '', total))
+        return '\n'.join(lines)
+
+
 class DES_Simulator():
     '''
     Discrete Event Simulation main body
@@ -85,7 +221,8 @@ class DES_Simulator():
                                   [4, 9, 4],
                                   [6, 9, 0],
                                   [0, 9, 4],
-                                  [0, 11, 0]]):
+                                  [0, 11, 0]],
+                    admission_schedule = None):
         # number of total days in the simulation, all starting from STARTING_DAY
         self.n_input_days = 1
         self.n_days = n_days + self.n_input_days
@@ -97,12 +234,16 @@ class DES_Simulator():
         self.floor_noncovid_census = None
 
         # cohort tracker, ch = cohort
-        # e.g. sh_tracker[(i, 'icu')] is a list of patient type i in icu, with ind:value = remain_los: n_patients
-        self.ch_tracker = {}
+        # Cohort_Tracker of a single scenario, counts[0, i] is patient type i with ind:value = [remain_los, stay]: n_patients
+        self.ch_tracker = None
 
         # parameters for new admission generator
         self.starting_total = starting_total
         self.doubling_time = doubling_time
+        # total admissions of each day [day], None for the growth of starting_total and doubling_time
+        self.admission_schedule = admission_schedule
+        # admissions [day, cohort] of the whole horizon, built when a run starts
+        self.admissions = None
 
         # parameters for patient cohort
         self.cohort_fraction = cohort_fraction
@@ -114,37 +255,41 @@ class DES_Simulator():
         self.max_los = np.max(self.los)
 
         # parameter for simulation start day index
+        # last day in the census arrays, observed or simulated
+        self.day = None
 
+        # non-COVID census means, used for days that are not observed
+        self.icu_census_noncovid_mean = None
+        self.floor_census_noncovid_mean = None
+
+        # optional Instrumentation of the simulation loop, None runs the plain loop
+        self.instrumentation = None
 
     def state_init(self, icu_census_covid_0 = 1, floor_census_covid_0 = 1,
                         icu_census_noncovid_mean = 67, floor_census_noncovid_mean = 86,
                         df_input_census = None):
 
-        # df_input_census = pd.read_csv('input_census.csv')
-        # # print(df_input_census.shape)
-        # # print(df_input_census.columns)
+        self.icu_census_noncovid_mean = icu_census_noncovid_mean
+        self.floor_census_noncovid_mean = floor_census_noncovid_mean
+
+        # df_input_census is a dataframe or an Input_Census from read_input_census
         if df_input_census is not None:
-            # initialze the census given the input
-            df_input_census[COL_DAY] = np.arange(len(df_input_census))
-            # only select the non empty rows
-            df_input_census = df_input_census.loc[~df_input_census[INPUT_COL_ICU_COVID].isna()]
-            self.n_input_days = len(df_input_census)
+            # initialze the census given the input, only the non empty rows
+            days, icu_covid, icu_noncovid, floor_covid, floor_noncovid = _input_census_arrays(df_input_census)
+            self.n_input_days = len(days)
             self.n_days += (self.n_input_days-1) # current days + projected days
-            # print(self.n_input_days, self.n_days)
             self.icu_covid_census = np.zeros(self.n_days)
             self.floor_covid_census = np.zeros(self.n_days)
             self.icu_noncovid_census = np.ones(self.n_days) * icu_census_noncovid_mean
             self.floor_noncovid_census = np.ones(self.n_days) * floor_census_noncovid_mean
 
-            for _, row in df_input_census.iterrows():
-                day = row[COL_DAY]
-                self.icu_covid_census[day] = row[INPUT_COL_ICU_COVID]
-                self.floor_covid_census[day] = row[INPUT_COL_FLOOR_COVID]
-                self.icu_noncovid_census[day] = row[INPUT_COL_ICU_NONCOVID]
-                self.floor_noncovid_census[day] = row[INPUT_COL_FLOOR_NONCOVID]
+            self.icu_covid_census[days] = icu_covid
+            self.floor_covid_census[days] = floor_covid
+            self.icu_noncovid_census[days] = icu_noncovid
+            self.floor_noncovid_census[days] = floor_noncovid
 
             # up the the initial census by the last row
-            icu_census_covid_0, floor_census_covid_0 = row[INPUT_COL_ICU_COVID], row[INPUT_COL_FLOOR_COVID]
+            icu_census_covid_0, floor_census_covid_0 = icu_covid[-1], floor_covid[-1]
         else:
             self.icu_covid_census = np.zeros(self.n_days)
             self.floor_covid_census = np.zeros(self.n_days)
@@ -153,30 +298,26 @@ class DES_Simulator():
             self.icu_covid_census[0] = icu_census_covid_0
             self.floor_covid_census[0] = floor_census_covid_0
 
+        self.seed_ch_tracker(icu_census_covid_0, floor_census_covid_0)
+        self.day = self.n_input_days - 1
+
+    def seed_ch_tracker(self, icu_census_covid_0, floor_census_covid_0):
         # initialized by evenly distribution
         # calculate the allocation fraction according to los and fraction
-        all_fractions = np.array(self.los)
-        all_fractions = np.array(self.cohort_fraction).reshape([len(all_fractions), 1]) * all_fractions
-        all_fractions = all_fractions / np.sum(all_fractions, axis = 0)
-        # print(all_fractions)
-
-        for pa_ind in range(self.num_cohorts):
-            counters = np.zeros([self.max_los + 1, self.num_stays])
-            for col_ind in range(2):
-                fraction = all_fractions[pa_ind, col_ind]
-                if fraction > 0 and col_ind == 0:
-                    los = self.los[pa_ind][col_ind]
-                    counters[:los, col_ind] = floor_census_covid_0 * fraction / los
-                elif fraction > 0 and col_ind == 1:
-                    los = self.los[pa_ind][col_ind]
-                    counters[:los, col_ind] = icu_census_covid_0 * fraction / los
-            # print(pa_ind, counters)
-            # print(np.sum(counters, axis = 0))
-            self.ch_tracker[pa_ind] = counters
-
+        los = np.array(self.los)[np.newaxis]
+        self.ch_tracker = Cohort_Tracker(los,
+                                         _initial_tracker(los, np.array(self.cohort_fraction, dtype = float)[np.newaxis],
+                                                          icu_census_covid_0, floor_census_covid_0,
+                                                          self.max_los + 1))
 
     def run(self):
 
+        self.admissions = self.admission_matrix()
+        if self.instrumentation is not None:
+            for day in self._instrumented_days():
+                pass
+            return None
+
         for day in range(self.n_input_days, self.n_days): # start from the next input day
 
             # update each cohort tracker
@@ -188,6 +329,7 @@ class DES_Simulator():
 
             # update the census tracker
             self.update_census(day)
+            self.day = day
 
             # print(day, self.ch_tracker[0])
 
@@ -203,17 +345,21 @@ class DES_Simulator():
         days_floor = self.n_days
         days_vent = self.n_days
 
-        for day in range(self.n_input_days, self.n_days):
+        self.admissions = self.admission_matrix()
+        is_instrumented = self.instrumentation is not None
+        for day in (self._instrumented_days() if is_instrumented else range(self.n_input_days, self.n_days)):
 
-            # update each cohort tracker
-            self.update_ch_tracker()
+            if not is_instrumented:
+                # update each cohort tracker
+                self.update_ch_tracker()
 
-            # generate new arrivals
-            new_patients = self.generate_new_admission(day)
-            self.patient_admission(new_patients)
+                # generate new arrivals
+                new_patients = self.generate_new_admission(day)
+                self.patient_admission(new_patients)
 
-            # update the census tracker
-            self.update_census(day)
+                # update the census tracker
+                self.update_census(day)
+                self.day = day
 
             if self.icu_covid_census[day] + self.icu_noncovid_census[day] > icu_cap:
                 if not is_icu_cap_hit: # only update when first time
@@ -237,66 +383,1160 @@ class DES_Simulator():
         # print(is_icu_cap_hit, is_floor_cap_hit)
         return [days_icu, days_floor, days_vent]
 
+    def _instrumented_days(self):
+        # the daily loop with each phase timed for self.instrumentation, yields each simulated day
+        for day in range(self.n_input_days, self.n_days):
+            start = time.perf_counter()
+            self.update_ch_tracker()
+            tracker_end = time.perf_counter()
+            new_patients = self.generate_new_admission(day)
+            self.patient_admission(new_patients)
+            admission_end = time.perf_counter()
+            self.update_census(day)
+            self.day = day
+            census_end = time.perf_counter()
+            self.instrumentation.record_day(self, day, [tracker_end - start, admission_end - tracker_end,
+                                                        census_end - admission_end])
+            yield day
+
 
     def update_ch_tracker(self):
-        # # patient remaininig los minus 1
-        # for pa_ind, counts in self.ch_tracker.items():
-        #     self.ch_tracker[pa_ind] = np.concatenate((counts[1:,:], [[0]*len(counts[0])]), axis = 0)
-
-        # transfers and dispatches
-        for pa_ind, counts in self.ch_tracker.items():
-            for col_ind in range(self.num_stays - 1):
-                counts[self.los[pa_ind][col_ind+1], col_ind+1] += counts[0, col_ind]
-                counts[0, col_ind] = 0
-                # counts[0, col_ind], counts[self.los[pa_ind][col_ind+1], col_ind+1] = 0, counts[0, col_ind]
-            # discharge from the last unit
-            counts[0, col_ind+1] = 0
-            self.ch_tracker[pa_ind] = counts
-
-        # patient remaininig los minus 1
-        for pa_ind, counts in self.ch_tracker.items():
-            self.ch_tracker[pa_ind] = np.concatenate((counts[1:,:], [[0]*len(counts[0])]), axis = 0)
+        # transfers, dispatches and patient remaininig los minus 1
+        self.ch_tracker.advance()
         return None
 
+    def admission_matrix(self):
+        # new patients [day, cohort] of every day of the simulation
+        total_admission = _admission_totals(self.n_days, self.starting_total, self.doubling_time, self.admission_schedule)
+        return total_admission[:, np.newaxis] * np.array(self.cohort_fraction, dtype = float)
+
     def generate_new_admission(self, day):
         # assume day > 0
-        total_admission = self.starting_total * 2**((day - 1)/self.doubling_time) * (2**(1/self.doubling_time)-1)
         # print('total patient day', day, total_admission)
-        new_patients = {}
-        for pa_ind in range(self.num_cohorts):
-            new_patients[pa_ind] = total_admission * self.cohort_fraction[pa_ind]
-        return new_patients
+        return self.admissions[day]
 
     def patient_admission(self, new_patients):
-        for pa_ind in range(self.num_cohorts):
-            # print(new_patients)
-            counts, new_admission, los_list = self.ch_tracker[pa_ind], new_patients[pa_ind], self.los[pa_ind]
-            for j in range(self.num_stays):
-                if los_list[j] > 0:
-                    break # find the first unit that has 0 los
-            counts[los_list[j]-1, j] += new_admission
-            self.ch_tracker[pa_ind] = counts
+        # new_patients[pa_ind] goes to the first unit with nonzero los
+        self.ch_tracker.admit(new_patients)
         return None
 
     def update_census(self, day):
-        for pa_ind in range(self.num_cohorts):
-            self.icu_covid_census[day] += np.sum(self.ch_tracker[pa_ind][:, 1])
-            self.floor_covid_census[day] += np.sum(self.ch_tracker[pa_ind])
+        stay_census = self.ch_tracker.stay_census()[0]
+        self.icu_covid_census[day] += stay_census[1]
+        self.floor_covid_census[day] += np.sum(stay_census)
         self.floor_covid_census[day] -= self.icu_covid_census[day]
         return None
 
-    def save_census(self, dir_name = 'result_table'):
-        df_result = pd.DataFrame()
-        df_result[COL_DAY] = range(self.n_days)
-        df_result[COL_CENSUS_ICU_COVID] = self.icu_covid_census
-        df_result[COL_CENSUS_ICU_NONCOVID] = self.icu_noncovid_census
-        df_result[COL_CENSUS_FLOOR_COVID] = self.floor_covid_census
-        df_result[COL_CENSUS_FLOOR_NONCOVID] = self.floor_noncovid_census
-        print(df_result)
+    def census(self):
+        # census of every day as a structured array of CENSUS_DTYPE
+        return census_records(self.icu_covid_census, self.icu_noncovid_census,
+                              self.floor_covid_census, self.floor_noncovid_census)
+
+    def save_census(self, dir_name = 'result_table', verbose = False):
+        df_result = records_frame(self.census(), CENSUS_FIELDS)
+        if verbose:
+            print(df_result)
         # df_result.to_csv(dir_name + '.csv')
         return df_result
 
+    def save_checkpoint(self, file):
+        '''
+        compact binary state: parameters, census arrays, tracker and day index
+        file is a path or a binary file object
+        '''
+        if self.ch_tracker is None:
+            raise ValueError('nothing to checkpoint before state_init')
+        np.savez_compressed(file,
+                            n_input_days = self.n_input_days, n_days = self.n_days, day = self.day,
+                            starting_total = self.starting_total, doubling_time = self.doubling_time,
+                            cohort_fraction = np.array(self.cohort_fraction, dtype = float),
+                            los_matrix = np.array(self.los),
+                            icu_census_noncovid_mean = self.icu_census_noncovid_mean,
+                            floor_census_noncovid_mean = self.floor_census_noncovid_mean,
+                            icu_covid_census = self.icu_covid_census, icu_noncovid_census = self.icu_noncovid_census,
+                            floor_covid_census = self.floor_covid_census, floor_noncovid_census = self.floor_noncovid_census,
+                            ch_tracker = self.ch_tracker.to_array(),
+                            admission_schedule = np.zeros(0) if self.admission_schedule is None else self.admission_schedule)
+        return None
+
+    @classmethod
+    def load_checkpoint(cls, file):
+        with np.load(file) as checkpoint:
+            simulator = cls(int(checkpoint['n_days']) - 1,
+                            float(checkpoint['starting_total']),
+                            float(checkpoint['doubling_time']),
+                            checkpoint['cohort_fraction'].tolist(),
+                            checkpoint['los_matrix'].tolist(),
+                            checkpoint['admission_schedule'] if len(checkpoint['admission_schedule']) > 0 else None)
+            simulator.n_input_days = int(checkpoint['n_input_days'])
+            simulator.n_days = int(checkpoint['n_days'])
+            simulator.day = int(checkpoint['day'])
+            simulator.icu_census_noncovid_mean = float(checkpoint['icu_census_noncovid_mean'])
+            simulator.floor_census_noncovid_mean = float(checkpoint['floor_census_noncovid_mean'])
+            simulator.icu_covid_census = checkpoint['icu_covid_census']
+            simulator.icu_noncovid_census = checkpoint['icu_noncovid_census']
+            simulator.floor_covid_census = checkpoint['floor_covid_census']
+            simulator.floor_noncovid_census = checkpoint['floor_noncovid_census']
+            simulator.ch_tracker = Cohort_Tracker(checkpoint['los_matrix'][np.newaxis], checkpoint['ch_tracker'])
+        return simulator
+
+    def observe_day(self, icu_covid, icu_noncovid, floor_covid, floor_noncovid):
+        '''
+        append one observed day, the state is then the one state_init builds from the input census
+        with that extra row, and run() projects the same number of days forward from it
+        only the last observed day seeds the tracker, so the history is never replayed
+        '''
+        n_observed = self.n_input_days
+        self.n_input_days += 1
+        self.n_days += 1
+        for name, observed, mean in [('icu_covid_census', icu_covid, 0),
+                                     ('floor_covid_census', floor_covid, 0),
+                                     ('icu_noncovid_census', icu_noncovid, self.icu_census_noncovid_mean),
+                                     ('floor_noncovid_census', floor_noncovid, self.floor_census_noncovid_mean)]:
+            census = np.ones(self.n_days) * mean
+            census[:n_observed] = getattr(self, name)[:n_observed]
+            census[n_observed] = observed
+            setattr(self, name, census)
+        self.seed_ch_tracker(icu_covid, floor_covid)
+        self.day = n_observed
+        return None
+
+    def capacity_index(self):
+        # after run(), answers run_till_cap for any capacities without simulating again
+        return Capacity_Index(self.icu_covid_census, self.icu_noncovid_census,
+                              self.floor_covid_census, self.floor_noncovid_census,
+                              self.n_input_days)
+
+
+def growth_schedule(n_days, starting_total = 10, doubling_time = 7, observed_admissions = None):
+    '''
+    Admission schedule of the simulators: total admissions of the days 0 to n_days - 1, none on day 0
+        starting_total, doubling_time: broadcast against [..., day], a scalar, [scenario, 1] per scenario,
+                       or for doubling_time [day] or [scenario, day] for piecewise growth (interventions),
+                       the doubling time of day d setting the growth from day d - 1 to day d
+        observed_admissions: admissions of the first days, [day] or [scenario, day] from day 0 on,
+                             replacing the projected ones; the projection goes on from the last
+                             observed admissions, its growth kept and its level rescaled to them
+    the cumulative admissions grow as starting_total * 2**(sum of 1/doubling_time up to the day),
+    with a constant doubling time they are the admissions of DES_Simulator
+    '''
+    starting_total = np.asarray(starting_total, dtype = float)
+    doubling_time = np.asarray(doubling_time, dtype = float)
+    days = np.arange(n_days)
+    if doubling_time.ndim > 0 and doubling_time.shape[-1] > 1:
+        rate = 1/doubling_time[..., :n_days]
+        if rate.shape[-1] < n_days:
+            raise ValueError('doubling time covers %d days, the schedule needs %d' % (rate.shape[-1], n_days))
+        # exponent of the day before
+        previous = np.cumsum(np.where(days > 0, rate, 0), axis = -1) - rate
+        total_admission = starting_total * 2**previous * (2**rate-1)
+    else:
+        total_admission = starting_total * 2**((days - 1)/doubling_time) * (2**(1/doubling_time)-1)
+    total_admission = np.array(np.broadcast_to(total_admission, np.broadcast_shapes(np.shape(total_admission), (n_days,))))
+    if observed_admissions is not None:
+        observed_admissions = np.asarray(observed_admissions, dtype = float)[..., :n_days]
+        shape = np.broadcast_shapes(total_admission.shape, observed_admissions.shape[:-1] + (n_days,))
+        total_admission = np.array(np.broadcast_to(total_admission, shape))
+        n_observed = observed_admissions.shape[-1]
+        if 1 < n_observed < n_days:
+            projected_last = total_admission[..., n_observed - 1]
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                level = np.where(projected_last > 0, observed_admissions[..., -1] / projected_last, 1)
+            total_admission[..., n_observed:] *= level[..., np.newaxis]
+        total_admission[..., :n_observed] = observed_admissions
+    total_admission[..., 0] = 0
+    return total_admission
+
+
+def _admission_totals(n_days, starting_total, doubling_time, admission_schedule):
+    # total admissions [..., day] of a simulation, its schedule or the growth of its parameters
+    if admission_schedule is None:
+        return growth_schedule(n_days, starting_total, doubling_time)
+    admission_schedule = np.asarray(admission_schedule, dtype = float)
+    if admission_schedule.shape[-1] < n_days:
+        raise ValueError('admission schedule covers %d days, the simulation needs %d' % (admission_schedule.shape[-1], n_days))
+    return admission_schedule[..., :n_days]
+
+
+def _scenario_array(value, n_scenarios, n_dims, dtype = float):
+    '''
+    broadcast a parameter to one entry per scenario,
+    value is either shared (n_dims dimensions) or given per scenario (n_dims + 1 dimensions)
+    '''
+    value = np.asarray(value, dtype = dtype)
+    if value.ndim == n_dims:
+        value = value[np.newaxis]
+    return np.array(np.broadcast_to(value, (n_scenarios,) + value.shape[1:]))
+
+
+def _n_scenarios(*values_and_dims):
+    # number of scenarios implied by a list of (value, n_dims) pairs
+    n_scenarios = 1
+    for value, n_dims in values_and_dims:
+        value = np.asarray(value)
+        if value.ndim > n_dims:
+            n_scenarios = max(n_scenarios, value.shape[0])
+    return n_scenarios
+
+
+# observed census of one facility, arrays over its non-empty rows in day order
+Input_Census = collections.namedtuple('Input_Census', ['days', 'icu_covid', 'icu_noncovid', 'floor_covid', 'floor_noncovid'])
+
+INPUT_CENSUS_COLUMNS = [INPUT_COL_ICU_COVID, INPUT_COL_ICU_NONCOVID, INPUT_COL_FLOOR_COVID, INPUT_COL_FLOOR_NONCOVID]
+
+
+def _numeric_columns(frame, columns, first_row = 0, invalid = None):
+    '''
+    census columns of a dataframe chunk as one float array [row, column], checked in bulk
+    first_row is the position of the chunk in the whole input, for error messages
+    invalid: list that gets the [row, column] mask of non-numeric or negative values instead of raising
+    '''
+    missing = [column for column in columns if column not in frame.columns]
+    if missing:
+        raise ValueError('input census is missing columns: ' + ', '.join(missing))
+    pd = _pandas()
+    values = np.empty([len(frame), len(columns)])
+    mask = np.zeros([len(frame), len(columns)], dtype = bool)
+    for col_ind, column in enumerate(columns):
+        raw = frame[column]
+        values[:, col_ind] = pd.to_numeric(raw, errors = 'coerce')
+        mask[:, col_ind] = (np.isnan(values[:, col_ind]) & raw.notna().to_numpy()) | (values[:, col_ind] < 0)
+    if invalid is not None:
+        invalid.append(mask)
+    elif np.any(mask):
+        raise ValueError(_invalid_values_message(mask, columns, np.arange(len(frame)) + first_row))
+    return values
+
+
+def _invalid_values_message(mask, columns, rows, facility = None):
+    # first column with non-numeric or negative values, and its first rows in the input
+    name = '' if facility is None else ' of facility ' + str(facility)
+    col_ind = np.flatnonzero(np.any(mask, axis = 0))[0]
+    return ('input census%s column %s has invalid values in rows %s'
+            % (name, columns[col_ind], ', '.join(str(row) for row in rows[mask[:, col_ind]][:5])))
+
+
+def _input_census_arrays(df_input_census):
+    '''
+    non-empty rows of the input census (rows with an icu covid census) as an Input_Census,
+    a day is the position of the row in the input
+    '''
+    if isinstance(df_input_census, Input_Census):
+        return df_input_census
+    values = _numeric_columns(df_input_census, INPUT_CENSUS_COLUMNS)
+    rows = np.flatnonzero(~np.isnan(values[:, 0]))
+    return Input_Census(rows, *values[rows].T)
+
+
+def _check_census_days(days, dates = None, facility = None):
+    # every day from the first to the last is observed once
+    name = '' if facility is None else ' of facility ' + str(facility)
+    if len(days) == 0:
+        raise ValueError('input census%s has no rows with an ICU COVID census' % name)
+    if len(days) != days[-1] - days[0] + 1:
+        raise ValueError('input census%s has empty rows in between observed days' % name)
+    if dates is not None:
+        steps = np.diff(dates[days].astype('datetime64[D]').astype(np.int64))
+        if np.any(steps != 1):
+            raise ValueError('input census%s dates are not consecutive days, first break after row %d'
+                             % (name, days[np.argmax(steps != 1)]))
+    return None
+
+
+def _read_census_chunks(source, columns, chunksize):
+    # dataframe chunks of a dataframe, csv or parquet input, restricted to columns
+    pd = _pandas()
+    if isinstance(source, pd.DataFrame):
+        yield source
+    elif str(source).endswith('.parquet'):
+        import pyarrow.parquet as pq # optional, only needed for parquet input
+        parquet_file = pq.ParquetFile(source)
+        names = [column for column in columns if column in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size = chunksize, columns = names):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(source, chunksize = chunksize, usecols = lambda column: column in columns):
+            yield chunk
+
+
+def read_input_census(source, facility_col = None, chunksize = 100000, validate = True, errors = None):
+    '''
+    Column-wise ingestion of the input census
+        source: dataframe, or path of a csv or .parquet file (parquet needs pyarrow), read chunksize rows at a time
+        facility_col: column with the facility id of multi-facility inputs, rows of a facility in day order
+        validate: check that each facility's days (and dates when a Date column is given) have no gaps
+        errors: dict that gets the message of each facility with invalid values, or failing validation,
+                instead of raising, those facilities are left out of the result (multi-facility inputs only)
+    returns an Input_Census, or a dict of facility id -> Input_Census when facility_col is given
+    '''
+    pd = _pandas()
+    columns = INPUT_CENSUS_COLUMNS + [INPUT_COL_DATE] + ([facility_col] if facility_col is not None else [])
+    values, dates, facilities = [], [], []
+    # invalid values are reported per facility when the errors are collected
+    invalid = [] if facility_col is not None and errors is not None else None
+    n_rows = 0
+    for chunk in _read_census_chunks(source, columns, chunksize):
+        values.append(_numeric_columns(chunk, INPUT_CENSUS_COLUMNS, n_rows, invalid))
+        if INPUT_COL_DATE in chunk.columns:
+            dates.append(pd.to_datetime(chunk[INPUT_COL_DATE], errors = 'raise' if invalid is None else 'coerce')
+                         .to_numpy(dtype = 'datetime64[D]'))
+        if facility_col is not None:
+            facilities.append(chunk[facility_col].to_numpy())
+        n_rows += len(chunk)
+    values = np.concatenate(values) if values else np.zeros([0, len(INPUT_CENSUS_COLUMNS)])
+    dates = np.concatenate(dates) if dates and validate else None
+
+    if facility_col is None:
+        days = np.flatnonzero(~np.isnan(values[:, 0]))
+        if validate:
+            _check_census_days(days, dates)
+        return Input_Census(days, *values[days].T)
+
+    # group the rows of each facility, keeping their order
+    facilities = np.concatenate(facilities)
+    order = np.argsort(facilities, kind = 'stable')
+    facility_ids, starts = np.unique(facilities[order], return_index = True)
+    invalid = None if invalid is None else np.concatenate(invalid)
+    input_census = {}
+    for facility, rows in zip(facility_ids, np.split(order, starts[1:])):
+        if invalid is not None and np.any(invalid[rows]):
+            errors[facility] = _invalid_values_message(invalid[rows], INPUT_CENSUS_COLUMNS, rows, facility)
+            continue
+        days = np.flatnonzero(~np.isnan(values[rows, 0]))
+        if validate:
+            try:
+                _check_census_days(days, None if dates is None else dates[rows], facility)
+            except ValueError as error:
+                if errors is None:
+                    raise
+                errors[facility] = str(error)
+                continue
+        input_census[facility] = Input_Census(days, *values[rows[days]].T)
+    return input_census
+
+
+def check_input_census(input_census, facility = None):
+    '''
+    Input_Census of the census of one facility, a dataframe or an Input_Census
+    raises ValueError when its days, or the dates of a dataframe with a Date column, have gaps
+    '''
+    if isinstance(input_census, Input_Census):
+        _check_census_days(input_census.days, facility = facility)
+        return input_census
+    census = read_input_census(input_census, validate = False)
+    dates = None
+    if INPUT_COL_DATE in input_census.columns:
+        dates = _pandas().to_datetime(input_census[INPUT_COL_DATE]).to_numpy(dtype = 'datetime64[D]')
+    _check_census_days(census.days, dates, facility)
+    return census
+
+
+def _initial_tracker(los, cohort_fraction, icu_census_covid_0, floor_census_covid_0, n_rows):
+    '''
+    evenly distributed starting tracker, same rule as DES_Simulator.state_init
+    los: [scenario, cohort, stay], cohort_fraction: [scenario, cohort], census: [scenario]
+    returns [scenario, cohort, remaining los, stay]
+    '''
+    n_scenarios, n_cohorts, n_stays = los.shape
+    all_fractions = cohort_fraction[:, :, np.newaxis] * los
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        all_fractions = all_fractions / np.sum(all_fractions, axis = 1, keepdims = True)
+
+    # only the first floor stay and the icu stay are seeded
+    census_0 = np.zeros([n_scenarios, n_stays])
+    census_0[:, 0] = floor_census_covid_0
+    census_0[:, 1] = icu_census_covid_0
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        per_day = census_0[:, np.newaxis, :] * all_fractions / los
+    per_day = np.where(all_fractions > 0, per_day, 0)
+    in_stay = np.arange(n_rows)[np.newaxis, np.newaxis, :, np.newaxis] < los[:, :, np.newaxis, :]
+    return per_day[:, :, np.newaxis, :] * in_stay
+
+
+def _transfer_index(los):
+    '''
+    for each (scenario, cohort, stay) with positive los, the next stay with positive los,
+    patients leaving a stay with no such successor are discharged
+    returns (scenario, cohort, stay, next_stay) index arrays of the transfers
+    '''
+    n_stays = los.shape[-1]
+    next_stay = np.full(los.shape, -1)
+    for col_ind in range(n_stays - 2, -1, -1):
+        next_stay[..., col_ind] = np.where(los[..., col_ind + 1] > 0, col_ind + 1, next_stay[..., col_ind + 1])
+    sc_ind, pa_ind, col_ind = np.nonzero((los > 0) & (next_stay >= 0))
+    return sc_ind, pa_ind, col_ind, next_stay[sc_ind, pa_ind, col_ind]
+
+
+class Cohort_Tracker():
+    '''
+    Patients of all cohorts in one contiguous array, [scenario, cohort, remaining los, stay]
+    remaining los is a ring buffer: the daily shift moves the head row instead of copying the array
+    '''
+    __slots__ = ('counts', 'head', 'n_rows', 'los', 'transfer_index', 'admission_index')
+
+    def __init__(self, los, counts):
+        # los: [scenario, cohort, stay], counts: [scenario, cohort, remaining los, stay]
+        self.los = np.asarray(los, dtype = int)
+        self.counts = np.array(counts, dtype = float, order = 'C')
+        self.n_rows = self.counts.shape[2]
+        self.head = 0
+
+        # fixed positions of transfers and admissions, los is relative to the head
+        sc_ind, pa_ind, col_ind, next_col = _transfer_index(self.los)
+        self.transfer_index = (sc_ind, pa_ind, col_ind, next_col, self.los[sc_ind, pa_ind, next_col] - 1)
+        sc_ind, pa_ind = np.indices(self.los.shape[:2]).reshape(2, -1)
+        first_col = np.argmax(self.los > 0, axis = 2).ravel()
+        # patients of a cohort without any los stay until their scenario's longest los has passed, as in DES_Simulator
+        first_los = self.los[sc_ind, pa_ind, first_col]
+        max_los = np.max(self.los, axis = (1, 2))[sc_ind]
+        self.admission_index = (sc_ind, pa_ind, np.where(first_los > 0, first_los - 1, max_los), first_col)
+
+    def advance(self):
+        # transfers and discharges leave from remaining los 0
+        sc_ind, pa_ind, col_ind, next_col, next_row = self.transfer_index
+        transfers = self.counts[sc_ind, pa_ind, self.head, col_ind]
+
+        # patient remaininig los minus 1, the old row 0 becomes the empty last row
+        self.counts[:, :, self.head, :] = 0
+        self.head = (self.head + 1) % self.n_rows
+
+        self.counts[sc_ind, pa_ind, (self.head + next_row) % self.n_rows, next_col] += transfers
+        return None
+
+    def admit(self, new_patients):
+        # new_patients: [scenario, cohort]
+        sc_ind, pa_ind, row, col_ind = self.admission_index
+        self.counts[sc_ind, pa_ind, (self.head + row) % self.n_rows, col_ind] += np.ravel(new_patients)
+        return None
+
+    def stay_census(self):
+        # [scenario, stay]
+        return np.sum(self.counts, axis = (1, 2))
+
+    def to_array(self):
+        # counts with remaining los in order, [scenario, cohort, remaining los, stay]
+        return np.roll(self.counts, -self.head, axis = 2)
+
+
+def _first_exceedance(demand, capacity, start_day, n_days):
+    '''
+    first day from start_day on where demand [scenario, day] exceeds capacity [scenario],
+    n_days if it never does
+    '''
+    over = demand[:, start_day:] > np.asarray(capacity, dtype = float).reshape(-1, 1)
+    return np.where(np.any(over, axis = 1), np.argmax(over, axis = 1) + start_day, n_days)
+
+
+class Capacity_Index():
+    '''
+    First days over capacity for any number of capacities, from one simulated census trajectory
+    the running maximum of a demand never decreases, so its first day above a capacity is a binary search
+    days follow run_till_cap: counted from day 0, searched from the first projected day, n_days if never
+    '''
+    def __init__(self, icu_covid_census, icu_noncovid_census, floor_covid_census, floor_noncovid_census,
+                    n_input_days = 1):
+        self.start_day = n_input_days
+        self.n_days = len(icu_covid_census)
+        self.icu_covid = np.asarray(icu_covid_census, dtype = float)[n_input_days:]
+        self.icu_noncovid = np.asarray(icu_noncovid_census, dtype = float)[n_input_days:]
+        self.icu_max = np.maximum.accumulate(self.icu_covid + self.icu_noncovid)
+        self.floor_max = np.maximum.accumulate(np.asarray(floor_covid_census, dtype = float)[n_input_days:] +
+                                               np.asarray(floor_noncovid_census, dtype = float)[n_input_days:])
+        # ventilator running maximum for each percentage asked so far
+        self.vent_max = {}
+
+    def _first_day(self, running_max, capacity):
+        ind = np.searchsorted(running_max, capacity, side = 'right')
+        return np.where(ind < len(running_max), ind + self.start_day, self.n_days)
+
+    def icu_cap_days(self, icu_cap):
+        return self._first_day(self.icu_max, np.asarray(icu_cap, dtype = float))
+
+    def floor_cap_days(self, floor_cap):
+        return self._first_day(self.floor_max, np.asarray(floor_cap, dtype = float))
+
+    def vent_cap_days(self, vent_cap, vent_percent):
+        # vent_cap and vent_percent broadcast against each other
+        vent_cap, vent_percent = np.broadcast_arrays(np.asarray(vent_cap, dtype = float),
+                                                     np.asarray(vent_percent, dtype = float))
+        days = np.zeros(vent_cap.shape, dtype = int)
+        for percent in np.unique(vent_percent):
+            if percent not in self.vent_max:
+                self.vent_max[percent] = np.maximum.accumulate(self.icu_covid + self.icu_noncovid * percent)
+            same_percent = vent_percent == percent
+            days[same_percent] = self._first_day(self.vent_max[percent], vent_cap[same_percent])
+        return days
+
+    def cap_days(self, icu_cap, floor_cap, vent_cap, vent_percent):
+        '''
+        all arguments broadcast against each other,
+        returns [..., (icu, floor, vent)] first days over capacity
+        '''
+        icu_cap, floor_cap, vent_cap, vent_percent = np.broadcast_arrays(icu_cap, floor_cap, vent_cap, vent_percent)
+        return np.stack([self.icu_cap_days(icu_cap),
+                         self.floor_cap_days(floor_cap),
+                         self.vent_cap_days(vent_cap, vent_percent)], axis = -1)
+
+
+class Batch_DES_Simulator():
+    '''
+    Vectorized DES_Simulator, advancing many scenarios in one numpy step per day
+    the tracker is a single array indexed by [scenario, cohort, remaining los, stay]
+    each parameter is either shared by all scenarios or given with one leading entry per scenario
+    '''
+    def __init__(self, n_days = 10,
+                    starting_total = 10,
+                    doubling_time = 7,
+                    cohort_fraction = [0.704, 0.13, 0.018, 0.13, 0.018],
+                    los_matrix = [[5, 0, 0],
+                                  [4, 9, 4],
+                                  [6, 9, 0],
+                                  [0, 9, 4],
+                                  [0, 11, 0]],
+                    admission_schedule = None):
+        self.n_input_days = 1
+        self.n_days = n_days + self.n_input_days
+
+        self.n_scenarios = _n_scenarios((starting_total, 0), (doubling_time, 0),
+                                        (cohort_fraction, 1), (los_matrix, 2),
+                                        (admission_schedule, 1))
+
+        # census tracker, [scenario, day]
+        self.icu_covid_census = None
+        self.icu_noncovid_census = None
+        self.floor_covid_census = None
+        self.floor_noncovid_census = None
+
+        # cohort tracker, Cohort_Tracker over [scenario, cohort, remaining los, stay]
+        self.ch_tracker = None
+
+        # parameters for new admission generator
+        self.starting_total = _scenario_array(starting_total, self.n_scenarios, 0)
+        self.doubling_time = _scenario_array(doubling_time, self.n_scenarios, 0)
+        # total admissions of each day, [day] shared or [scenario, day], None for the growth of the parameters
+        self.admission_schedule = admission_schedule
+        # admissions [day, scenario, cohort] of the whole horizon, built when a run starts
+        self.admissions = None
+
+        # parameters for patient cohort
+        self.cohort_fraction = _scenario_array(cohort_fraction, self.n_scenarios, 1)
+        self.num_cohorts = self.cohort_fraction.shape[1]
+
+        # parameters for los
+        self.los = _scenario_array(los_matrix, self.n_scenarios, 2, dtype = int)
+        self.num_stays = self.los.shape[2]
+        self.max_los = np.max(self.los)
+
+    def state_init(self, icu_census_covid_0 = 1, floor_census_covid_0 = 1,
+                        icu_census_noncovid_mean = 67, floor_census_noncovid_mean = 86,
+                        df_input_census = None):
+        # census inputs are shared or per scenario,
+        # df_input_census is shared by all scenarios or a list with one input of the same length per scenario
+        icu_census_covid_0 = _scenario_array(icu_census_covid_0, self.n_scenarios, 0)
+        floor_census_covid_0 = _scenario_array(floor_census_covid_0, self.n_scenarios, 0)
+        icu_census_noncovid_mean = _scenario_array(icu_census_noncovid_mean, self.n_scenarios, 0)
+        floor_census_noncovid_mean = _scenario_array(floor_census_noncovid_mean, self.n_scenarios, 0)
+
+        if df_input_census is not None:
+            if isinstance(df_input_census, (list, tuple)) and not isinstance(df_input_census, Input_Census):
+                input_census = [_input_census_arrays(census) for census in df_input_census]
+                if len(set(len(census.days) for census in input_census)) > 1:
+                    raise ValueError('per scenario input census must have the same number of days')
+                days, icu_covid, icu_noncovid, floor_covid, floor_noncovid = [np.stack(field) for field in zip(*input_census)]
+            else:
+                days, icu_covid, icu_noncovid, floor_covid, floor_noncovid = _input_census_arrays(df_input_census)
+            self.n_input_days = days.shape[-1]
+            self.n_days += (self.n_input_days-1) # current days + projected days
+
+        self.icu_covid_census = np.zeros([self.n_scenarios, self.n_days])
+        self.floor_covid_census = np.zeros([self.n_scenarios, self.n_days])
+        self.icu_noncovid_census = np.ones([self.n_scenarios, self.n_days]) * icu_census_noncovid_mean[:, np.newaxis]
+        self.floor_noncovid_census = np.ones([self.n_scenarios, self.n_days]) * floor_census_noncovid_mean[:, np.newaxis]
+
+        if df_input_census is not None:
+            sc_ind = np.arange(self.n_scenarios)[:, np.newaxis]
+            self.icu_covid_census[sc_ind, days] = icu_covid
+            self.floor_covid_census[sc_ind, days] = floor_covid
+            self.icu_noncovid_census[sc_ind, days] = icu_noncovid
+            self.floor_noncovid_census[sc_ind, days] = floor_noncovid
+            # up the the initial census by the last row
+            icu_census_covid_0 = np.broadcast_to(icu_covid[..., -1], self.n_scenarios)
+            floor_census_covid_0 = np.broadcast_to(floor_covid[..., -1], self.n_scenarios)
+        else:
+            self.icu_covid_census[:, 0] = icu_census_covid_0
+            self.floor_covid_census[:, 0] = floor_census_covid_0
+
+        self.ch_tracker = Cohort_Tracker(self.los,
+                                         _initial_tracker(self.los, self.cohort_fraction,
+                                                          icu_census_covid_0, floor_census_covid_0,
+                                                          self.max_los + 1))
+
+    def run(self):
+
+        self.admissions = self.admission_matrix()
+        for day in range(self.n_input_days, self.n_days): # start from the next input day
+            self.update_ch_tracker()
+            self.patient_admission(self.generate_new_admission(day))
+            self.update_census(day)
+
+        return None
+
+    def run_till_cap(self, icu_cap, floor_cap, vent_cap, vent_percent):
+        '''
+        capacities and vent_percent are shared or per scenario,
+        returns [scenario, (icu, floor, vent)] first days over capacity, n_days if never
+        '''
+        self.run()
+        vent_percent = _scenario_array(vent_percent, self.n_scenarios, 0)
+        icu_demand = self.icu_covid_census + self.icu_noncovid_census
+        floor_demand = self.floor_covid_census + self.floor_noncovid_census
+        vent_demand = self.icu_covid_census + self.icu_noncovid_census * vent_percent[:, np.newaxis]
+        return np.stack([_first_exceedance(icu_demand, _scenario_array(icu_cap, self.n_scenarios, 0), self.n_input_days, self.n_days),
+                         _first_exceedance(floor_demand, _scenario_array(floor_cap, self.n_scenarios, 0), self.n_input_days, self.n_days),
+                         _first_exceedance(vent_demand, _scenario_array(vent_cap, self.n_scenarios, 0), self.n_input_days, self.n_days)],
+                        axis = 1)
+
+    def update_ch_tracker(self):
+        self.ch_tracker.advance()
+        return None
+
+    def admission_totals(self):
+        # total admissions [scenario, day] of every day of the simulation
+        total_admission = _admission_totals(self.n_days, self.starting_total[:, np.newaxis],
+                                            self.doubling_time[:, np.newaxis], self.admission_schedule)
+        return np.broadcast_to(total_admission, (self.n_scenarios, self.n_days))
+
+    def admission_matrix(self):
+        # new patients [day, scenario, cohort] of every day of the simulation
+        return self.admission_totals().T[:, :, np.newaxis] * self.cohort_fraction
+
+    def generate_new_admission(self, day):
+        # [scenario, cohort]
+        return self.admissions[day]
 
+    def patient_admission(self, new_patients):
+        self.ch_tracker.admit(new_patients)
+        return None
+
+    def update_census(self, day):
+        stay_census = self.ch_tracker.stay_census()
+        self.icu_covid_census[:, day] += stay_census[:, 1]
+        self.floor_covid_census[:, day] += np.sum(stay_census, axis = 1)
+        self.floor_covid_census[:, day] -= self.icu_covid_census[:, day]
+        return None
+
+    def census(self):
+        # census [scenario, day] as a structured array of CENSUS_DTYPE
+        return census_records(self.icu_covid_census, self.icu_noncovid_census,
+                              self.floor_covid_census, self.floor_noncovid_census)
+
+    def save_census(self, scenario = 0):
+        return records_frame(self.census()[scenario], CENSUS_FIELDS)
+
+    def capacity_index(self, scenario = 0):
+        # after run(), answers run_till_cap of one scenario for any capacities
+        return Capacity_Index(self.icu_covid_census[scenario], self.icu_noncovid_census[scenario],
+                              self.floor_covid_census[scenario], self.floor_noncovid_census[scenario],
+                              self.n_input_days)
+
+
+def _cohort_occupancy(los, tracker, n_days):
+    '''
+    census the tracked patients still contribute when no one else is admitted,
+    a patient at remaining los r of a stay is counted there r more days and then goes through the remaining stays
+    los: [scenario, cohort, stay], tracker: [scenario, cohort, remaining los, stay] with remaining los in order
+    returns (icu, floor) census, each [scenario, cohort, day]
+    '''
+    n_scenarios, n_cohorts, n_rows, n_stays = tracker.shape
+    cum_los = np.cumsum(los, axis = 2)
+    remaining = np.arange(n_rows)[np.newaxis, np.newaxis, :, np.newaxis, np.newaxis]
+    col_ind = np.arange(n_stays)[:, np.newaxis]
+    next_col = np.arange(n_stays)[np.newaxis, :]
+
+    # [scenario, cohort, remaining los, stay now, stay visited]
+    end = remaining + cum_los[:, :, np.newaxis, np.newaxis, :] - cum_los[:, :, np.newaxis, :, np.newaxis]
+    start = np.where(next_col == col_ind, 0, end - los[:, :, np.newaxis, np.newaxis, :])
+    patients = np.broadcast_to(tracker[:, :, :, :, np.newaxis], end.shape)
+    visited = (next_col >= col_ind) & (patients != 0) & (end > start)
+
+    sc_ind, pa_ind, _, _, visited_col = np.nonzero(visited)
+    is_icu = (visited_col == 1).astype(int)
+    offset = ((sc_ind * n_cohorts + pa_ind) * 2 + is_icu) * (n_days + 1)
+    weights = patients[visited]
+    n_bins = n_scenarios * n_cohorts * 2 * (n_days + 1)
+    changes = (np.bincount(offset + np.clip(start[visited], 0, n_days), weights = weights, minlength = n_bins)
+               - np.bincount(offset + np.clip(end[visited], 0, n_days), weights = weights, minlength = n_bins))
+    census = np.cumsum(changes.reshape(n_scenarios, n_cohorts, 2, n_days + 1), axis = 3)[..., :n_days]
+    return census[:, :, 1], census[:, :, 0]
+
+
+def _admission_kernels(los):
+    '''
+    census contributed by one patient admitted on day 0, who starts at the first stay with nonzero los
+    returns (icu, floor) kernels, each [scenario, cohort, day since admission]
+    '''
+    n_scenarios, n_cohorts, n_stays = los.shape
+    tracker = np.zeros([n_scenarios, n_cohorts, np.max(los) + 1, n_stays])
+    sc_ind, pa_ind = np.indices([n_scenarios, n_cohorts]).reshape(2, -1)
+    first_col = np.argmax(los > 0, axis = 2).ravel()
+    tracker[sc_ind, pa_ind, los[sc_ind, pa_ind, first_col], first_col] = 1
+    max_los = np.max(los, axis = (1, 2))
+    icu_kernel, floor_kernel = _cohort_occupancy(los, tracker, max(np.max(np.sum(los, axis = 2)), np.max(max_los) + 1))
+    # a cohort without any los stays on the floor for its scenario's longest los and the admission day, as in DES_Simulator
+    sc_ind, pa_ind = np.nonzero(np.all(los == 0, axis = 2))
+    floor_kernel[sc_ind, pa_ind] = np.arange(floor_kernel.shape[2]) <= max_los[sc_ind, np.newaxis]
+    return icu_kernel, floor_kernel
+
+
+def _causal_convolve(signal, kernel, growth = None, method = 'auto'):
+    '''
+    out[:, t] = sum_k kernel[:, k] * signal[:, t - k] for each row, over the days of signal
+    method is 'direct', 'fft' or 'auto' (fft from FFT_CONVOLUTION_MIN_DAYS days on)
+    with fft both series are tilted by growth**-t so that exponential admissions keep their relative precision
+    '''
+    n_rows, n_days = signal.shape
+    kernel = kernel[:, :n_days]
+    n_kernel = kernel.shape[1]
+    if method == 'auto':
+        method = 'fft' if n_days >= FFT_CONVOLUTION_MIN_DAYS else 'direct'
+
+    if method == 'direct':
+        out = np.zeros([n_rows, n_days])
+        for k in range(n_kernel):
+            out[:, k:] += kernel[:, k:k+1] * signal[:, :n_days-k]
+        return out
+    elif method == 'fft':
+        log_growth = np.zeros([n_rows, 1]) if growth is None else np.log(np.asarray(growth, dtype = float)).reshape(-1, 1)
+        n_fft = 1 << int(np.ceil(np.log2(n_days + n_kernel - 1)))
+        tilted = (np.fft.rfft(signal * np.exp(-log_growth * np.arange(n_days)), n_fft, axis = 1)
+                  * np.fft.rfft(kernel * np.exp(-log_growth * np.arange(n_kernel)), n_fft, axis = 1))
+        return np.fft.irfft(tilted, n_fft, axis = 1)[:, :n_days] * np.exp(log_growth * np.arange(n_days))
+    else:
+        raise ValueError('unknown convolution method: ' + str(method))
+
+
+def _schedule_growth(admissions):
+    # daily growth ratio of each row of [row, day] admissions, None unless every row grows at one ratio
+    if admissions.shape[1] < 2 or np.any(admissions <= 0):
+        return None
+    ratio = admissions[:, 1:] / admissions[:, :-1]
+    growth = np.max(ratio, axis = 1)
+    return growth if np.allclose(np.min(ratio, axis = 1), growth, rtol = 1e-9, atol = 0) else None
+
+
+class Convolution_Projector(Batch_DES_Simulator):
+    '''
+    Closed form projector with the interface and results of Batch_DES_Simulator
+    the covid census is the decay of the starting tracker plus the admissions convolved
+    with each cohort's icu/floor occupancy kernel, computed for the whole horizon at once
+    '''
+    def __init__(self, n_days = 10,
+                    starting_total = 10,
+                    doubling_time = 7,
+                    cohort_fraction = [0.704, 0.13, 0.018, 0.13, 0.018],
+                    los_matrix = [[5, 0, 0],
+                                  [4, 9, 4],
+                                  [6, 9, 0],
+                                  [0, 9, 4],
+                                  [0, 11, 0]],
+                    method = 'auto',
+                    admission_schedule = None):
+        Batch_DES_Simulator.__init__(self, n_days, starting_total, doubling_time, cohort_fraction, los_matrix,
+                                     admission_schedule)
+        # 'direct', 'fft' or 'auto'
+        self.method = method
+
+    def generate_all_admissions(self):
+        # [scenario, projected day]
+        return self.admission_totals()[:, self.n_input_days:]
+
+    def run(self):
+        # the tracker is left at its starting state
+        n_projected = self.n_days - self.n_input_days
+        icu_decay, floor_decay = _cohort_occupancy(self.los, self.ch_tracker.to_array(), n_projected)
+
+        icu_kernel, floor_kernel = _admission_kernels(self.los)
+        fraction = self.cohort_fraction[:, :, np.newaxis]
+        kernels = np.concatenate([np.sum(icu_kernel * fraction, axis = 1), np.sum(floor_kernel * fraction, axis = 1)])
+        admissions = self.generate_all_admissions()
+        # the fft tilt follows the growth of the admissions, a schedule without one growth is convolved directly
+        if self.admission_schedule is None:
+            growth, method = 2**(1/self.doubling_time), self.method
+        else:
+            growth = _schedule_growth(admissions)
+            method = self.method if growth is not None else 'direct'
+        icu_admitted, floor_admitted = np.split(_causal_convolve(np.tile(admissions, (2, 1)), kernels,
+                                                                 None if growth is None else np.tile(growth, 2), method), 2)
+
+        self.icu_covid_census[:, self.n_input_days:] += np.sum(icu_decay, axis = 1) + icu_admitted
+        self.floor_covid_census[:, self.n_input_days:] += np.sum(floor_decay, axis = 1) + floor_admitted
+        return None
+
+
+class Monte_Carlo_Simulator(Batch_DES_Simulator):
+    '''
+    Batch of replicates with random los and admissions, one scenario per replicate
+    each nonzero los cell is drawn once per replicate, admissions are drawn every day around
+    the expected admissions of generate_new_admission
+        los_distribution: 'poisson' (at least 1 day), 'fixed', or f(rng, los_matrix, n_replicates) -> [replicate, cohort, stay]
+        admission_distribution: 'poisson', 'negative_binomial' (variance mean + mean**2 / dispersion) or 'fixed'
+    '''
+    def __init__(self, n_days = 10,
+                    starting_total = 10,
+                    doubling_time = 7,
+                    cohort_fraction = [0.704, 0.13, 0.018, 0.13, 0.018],
+                    los_matrix = [[5, 0, 0],
+                                  [4, 9, 4],
+                                  [6, 9, 0],
+                                  [0, 9, 4],
+                                  [0, 11, 0]],
+                    n_replicates = 1000,
+                    los_distribution = 'poisson',
+                    admission_distribution = 'poisson',
+                    dispersion = 10,
+                    rng = None,
+                    admission_schedule = None):
+        self.rng = np.random.default_rng(rng)
+        self.admission_distribution = admission_distribution
+        self.dispersion = dispersion
+
+        los_matrix = np.asarray(los_matrix, dtype = int)
+        if callable(los_distribution):
+            los_replicates = los_distribution(self.rng, los_matrix, n_replicates)
+        elif los_distribution == 'poisson':
+            los_replicates = np.where(los_matrix > 0, np.maximum(self.rng.poisson(los_matrix, (n_replicates,) + los_matrix.shape), 1), 0)
+        elif los_distribution == 'fixed':
+            los_replicates = np.broadcast_to(los_matrix, (n_replicates,) + los_matrix.shape)
+        else:
+            raise ValueError('unknown los distribution: ' + str(los_distribution))
+        Batch_DES_Simulator.__init__(self, n_days, starting_total, doubling_time, cohort_fraction, los_replicates,
+                                     admission_schedule)
+
+    def generate_new_admission(self, day):
+        expected = Batch_DES_Simulator.generate_new_admission(self, day)
+        if self.admission_distribution == 'poisson':
+            return self.rng.poisson(expected).astype(float)
+        elif self.admission_distribution == 'negative_binomial':
+            return self.rng.negative_binomial(self.dispersion, self.dispersion / (self.dispersion + expected)).astype(float)
+        elif self.admission_distribution == 'fixed':
+            return expected
+        raise ValueError('unknown admission distribution: ' + str(self.admission_distribution))
+
+
+class Streaming_Quantiles():
+    '''
+    Per-day quantiles of one census column over replicates that are added batch by batch
+    values are counted in log-spaced buckets of relative width relative_accuracy (values up to
+    min_value share a zero bucket), so memory depends on the range of the census, not on the number of replicates
+    the exact per-day minimum and maximum are kept as well and bound the returned quantiles
+    '''
+    def __init__(self, n_days, relative_accuracy = 0.005, min_value = 1e-3):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.base = int(np.ceil(np.log(min_value) / self.log_gamma))
+        self.min_value = min_value
+        self.n_days = n_days
+        self.n_values = 0
+        self.counts = np.zeros([n_days, 1])
+        self.minimum = np.full(n_days, np.inf)
+        self.maximum = np.full(n_days, -np.inf)
+
+    def add(self, values):
+        # values: [replicate, day]
+        values = np.asarray(values, dtype = float)
+        with np.errstate(divide = 'ignore'):
+            bucket = np.where(values > self.min_value,
+                              np.ceil(np.log(np.maximum(values, self.min_value)) / self.log_gamma) - self.base + 1, 0).astype(int)
+        n_buckets = np.max(bucket) + 1
+        if n_buckets > self.counts.shape[1]:
+            self.counts = np.pad(self.counts, [(0, 0), (0, n_buckets - self.counts.shape[1])])
+        n_buckets = self.counts.shape[1]
+        ind = np.arange(self.n_days) * n_buckets + bucket
+        self.counts += np.bincount(ind.ravel(), minlength = self.n_days * n_buckets).reshape(self.n_days, n_buckets)
+        self.minimum = np.minimum(self.minimum, np.min(values, axis = 0))
+        self.maximum = np.maximum(self.maximum, np.max(values, axis = 0))
+        self.n_values += len(values)
+        return None
+
+    def quantiles(self, quantiles):
+        # returns [quantile, day]
+        cum_counts = np.cumsum(self.counts, axis = 1)
+        bucket_values = 2 * self.gamma**(np.arange(self.counts.shape[1]) + self.base - 1) / (self.gamma + 1)
+        bucket_values[0] = 0
+        result = []
+        for q in np.atleast_1d(quantiles):
+            bucket = np.argmax(cum_counts > q * (self.n_values - 1), axis = 1)
+            result.append(np.clip(bucket_values[bucket], self.minimum, self.maximum))
+        return np.array(result)
+
+
+def monte_carlo_bands(n_days = 10,
+                      df_input_census = None,
+                      icu_census_covid_0 = 2, floor_census_covid_0 = 2,
+                      icu_census_noncovid_mean = 67, floor_census_noncovid_mean = 86,
+                      starting_total = 11,
+                      doubling_time = 6.2,
+                      cohort_fraction = [0.704, 0.13, 0.018, 0.13, 0.018],
+                      los_matrix = [[5, 0, 0],
+                                    [4, 9, 4],
+                                    [6, 9, 0],
+                                    [0, 9, 4],
+                                    [0, 11, 0]],
+                      n_replicates = 1000,
+                      batch_size = 1000,
+                      quantiles = [0.05, 0.25, 0.5, 0.75, 0.95],
+                      los_distribution = 'poisson',
+                      admission_distribution = 'poisson',
+                      dispersion = 10,
+                      seed = None,
+                      relative_accuracy = 0.005,
+                      store = None):
+    '''
+    Census quantile bands over Monte_Carlo_Simulator replicates, run batch_size replicates at a time
+    store: path of a Trajectory_Store (see trajectory_store.py) that also gets the census and drawn los of every replicate
+    Output: dataframe with one row per (quantile, day) and the four census columns
+    '''
+    rng = np.random.default_rng(seed)
+    columns = ['icu_covid_census', 'icu_noncovid_census', 'floor_covid_census', 'floor_noncovid_census']
+    sketches = None
+    for start in range(0, n_replicates, batch_size):
+        simulator = Monte_Carlo_Simulator(n_days,
+                                          starting_total,
+                                          doubling_time,
+                                          cohort_fraction,
+                                          los_matrix,
+                                          min(batch_size, n_replicates - start),
+                                          los_distribution,
+                                          admission_distribution,
+                                          dispersion,
+                                          rng)
+        simulator.state_init(icu_census_covid_0, floor_census_covid_0,
+                             icu_census_noncovid_mean, floor_census_noncovid_mean,
+                             df_input_census)
+        simulator.run()
+        if sketches is None:
+            sketches = [Streaming_Quantiles(simulator.n_days, relative_accuracy) for _ in columns]
+        if store is not None:
+            from trajectory_store import Trajectory_Store
+            los_names = ['los_matrix_%d_%d' % (i, j) for i in range(simulator.num_cohorts) for j in range(simulator.num_stays)]
+            if start == 0:
+                store = Trajectory_Store.create(store, n_replicates, simulator.n_days,
+                                                parameters = dict((name, np.zeros(n_replicates, dtype = int)) for name in los_names),
+                                                metadata = {'n_days': n_days, 'n_input_days': simulator.n_input_days,
+                                                            'los_distribution': str(los_distribution),
+                                                            'admission_distribution': admission_distribution})
+            store.write_simulator(start, simulator)
+            store.write_parameters(start, dict(zip(los_names, simulator.los.reshape(len(simulator.los), -1).T)))
+        for sketch, column in zip(sketches, columns):
+            sketch.add(getattr(simulator, column))
+
+    if store is not None:
+        store.close()
+
+    n_total_days = sketches[0].n_days
+    df_bands = _pandas().DataFrame()
+    df_bands[COL_QUANTILE] = np.repeat(quantiles, n_total_days)
+    df_bands[COL_DAY] = np.tile(np.arange(n_total_days), len(quantiles))
+    for sketch, column in zip(sketches, [COL_CENSUS_ICU_COVID, COL_CENSUS_ICU_NONCOVID,
+                                         COL_CENSUS_FLOOR_COVID, COL_CENSUS_FLOOR_NONCOVID]):
+        df_bands[column] = sketch.quantiles(quantiles).ravel()
+    return df_bands
+
+
+def _canonical_value(value):
+    # numbers hash the same whatever their type, so that 7, 7.0 and np.int64(7) share a result
+    if isinstance(value, (bool, np.bool_)) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return repr(float(value))
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_canonical_value(v) for v in value]
+    if isinstance(value, dict):
+        return dict((str(k), _canonical_value(v)) for k, v in value.items())
+    raise TypeError('cannot build a cache key from ' + type(value).__name__)
+
+
+@functools.lru_cache(maxsize = None)
+def _source_version():
+    '''
+    content hash of this file, part of every cache key so that the disk tier never serves
+    results of an older simulator; when the file cannot be read (source_python may run it
+    without __file__), the hash of the compiled code of every function and method
+    '''
+    try:
+        with open(__file__, 'rb') as source:
+            return hashlib.sha256(source.read()).hexdigest()
+    except (NameError, OSError):
+        pass
+    code = hashlib.sha256()
+    for value in list(globals().values()):
+        for member in [value] + (list(vars(value).values()) if isinstance(value, type) else []):
+            if inspect.isfunction(member) and member.__module__ == __name__:
+                code.update(marshal.dumps(member.__code__))
+    return code.hexdigest()
+
+
+def _census_content_hash(df_input_census):
+    # only the census read by state_init, with the day of each row
+    if df_input_census is None:
+        return None
+    input_census = _input_census_arrays(df_input_census)
+    values = np.stack([input_census.days] + list(input_census[1:]), axis = 1).astype(float)
+    return hashlib.sha256(np.ascontiguousarray(values).tobytes() + str(values.shape).encode()).hexdigest()
+
+
+class Result_Cache():
+    '''
+    Results keyed on a canonical hash of the scalar parameters and a content hash of df_input_census
+    an in-memory LRU of at most max_entries results, and optionally an on-disk tier in cache_dir
+    whose files expire after ttl_seconds and are evicted oldest first beyond max_disk_bytes
+    '''
+    def __init__(self, max_entries = CACHE_MAX_ENTRIES, cache_dir = CACHE_DIR,
+                    ttl_seconds = CACHE_TTL_SECONDS, max_disk_bytes = CACHE_MAX_DISK_BYTES):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = collections.OrderedDict()
+
+        # counters
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, func_name, parameters):
+        parameters = dict(parameters)
+        census_hash = _census_content_hash(parameters.pop('df_input_census', None))
+        content = json.dumps([_source_version(), func_name, _canonical_value(parameters), census_hash], sort_keys = True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, key):
+        '''
+        returns (found, result), the result is a copy that the caller may modify
+        '''
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, pickle.loads(self.entries[key])
+        if self.cache_dir is not None:
+            file_name = os.path.join(self.cache_dir, key + '.pkl')
+            try:
+                if time.time() - os.path.getmtime(file_name) <= self.ttl_seconds:
+                    with open(file_name, 'rb') as f:
+                        data = f.read()
+                    self._remember(key, data)
+                    self.disk_hits += 1
+                    return True, pickle.loads(data)
+                os.remove(file_name)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+        self.misses += 1
+        return False, None
+
+    def put(self, key, result):
+        data = pickle.dumps(result, protocol = pickle.HIGHEST_PROTOCOL)
+        self._remember(key, data)
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok = True)
+            file_name = os.path.join(self.cache_dir, key + '.pkl')
+            with open(file_name + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(file_name + '.tmp', file_name)
+            self._evict_disk()
+        return None
+
+    def _remember(self, key, data):
+        self.entries[key] = data
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last = False)
+
+    def _evict_disk(self):
+        # drop expired files, then the oldest ones until the tier fits in max_disk_bytes
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        total_bytes = sum(size for _, size, _ in files)
+        now = time.time()
+        for mtime, size, path in files:
+            if now - mtime <= self.ttl_seconds and total_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_bytes -= size
+
+    def clear(self, disk = True):
+        self.entries.clear()
+        if disk and self.cache_dir is not None and os.path.isdir(self.cache_dir):
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.pkl'):
+                    os.remove(entry.path)
+        return None
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'entries': len(self.entries)}
+
+
+# source_python() re-executes this file, keep the cache of the previous run
+if 'RESULT_CACHE' not in globals():
+    RESULT_CACHE = Result_Cache()
+
+
+def cached_result(func):
+    '''
+    Serve func from RESULT_CACHE, pass use_cache = False to bypass it
+    '''
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, use_cache = True, **kwargs):
+        if not use_cache:
+            return func(*args, **kwargs)
+        parameters = signature.bind(*args, **kwargs)
+        parameters.apply_defaults()
+        key = RESULT_CACHE.key(func.__name__, parameters.arguments)
+        found, result = RESULT_CACHE.get(key)
+        if not found:
+            result = func(*args, **kwargs)
+            RESULT_CACHE.put(key, result)
+        return result
+    return wrapper
+
+
+def cache_stats():
+    return RESULT_CACHE.stats()
+
+
+def clear_cache(disk = True):
+    RESULT_CACHE.clear(disk)
+    return None
+
+
+# default of the configure_cache settings that are left as they are
+_UNCHANGED = object()
+
+
+def configure_cache(max_entries = _UNCHANGED, cache_dir = _UNCHANGED, ttl_seconds = _UNCHANGED, max_disk_bytes = _UNCHANGED):
+    # only the given settings change, cache_dir = None turns the disk tier off
+    if max_entries is not _UNCHANGED:
+        RESULT_CACHE.max_entries = max_entries
+    if cache_dir is not _UNCHANGED:
+        RESULT_CACHE.cache_dir = cache_dir
+    if ttl_seconds is not _UNCHANGED:
+        RESULT_CACHE.ttl_seconds = ttl_seconds
+    if max_disk_bytes is not _UNCHANGED:
+        RESULT_CACHE.max_disk_bytes = max_disk_bytes
+    return None
+
+
+@cached_result
 def run_simulation(n_days = 10,
                    df_input_census = None,
                    icu_census_covid_0 = 2, floor_census_covid_0 = 2,
@@ -312,7 +1552,8 @@ def run_simulation(n_days = 10,
                    los_matrix_1_0 = 4, los_matrix_1_1 = 9, los_matrix_1_2 = 4,
                    los_matrix_2_0 = 6, los_matrix_2_1 = 9, los_matrix_2_2 = 0,
                    los_matrix_3_0 = 0, los_matrix_3_1 = 9, los_matrix_3_2 = 4,
-                   los_matrix_4_0 = 0, los_matrix_4_1 = 11, los_matrix_4_2 = 0
+                   los_matrix_4_0 = 0, los_matrix_4_1 = 11, los_matrix_4_2 = 0,
+                   method = 'des'
                    # cohort_fraction = [0.704, 0.13, 0.018, 0.13, 0.13],
                    # los_matrix = [[5, 0, 0],
                    #               [4, 9, 4],
@@ -320,6 +1561,11 @@ def run_simulation(n_days = 10,
                    #               [0, 9, 4],
                    #               [0, 11, 0]]
                    ):
+    '''
+    method: 'des' steps DES_Simulator day by day,
+            'convolution' (or 'direct'/'fft' to force the convolution) uses Convolution_Projector
+    Output: census dataframe, see project_census for the numpy result
+    '''
     cohort_fraction = [cohort_fraction_0, cohort_fraction_1, cohort_fraction_2, cohort_fraction_3, cohort_fraction_4]
     los_matrix = [[los_matrix_0_0, los_matrix_0_1, los_matrix_0_2],
                   [los_matrix_1_0, los_matrix_1_1, los_matrix_1_2],
@@ -327,21 +1573,323 @@ def run_simulation(n_days = 10,
                   [los_matrix_3_0, los_matrix_3_1, los_matrix_3_2],
                   [los_matrix_4_0, los_matrix_4_1, los_matrix_4_2]]
 
-    simulator = DES_Simulator(n_days,
-                              starting_total,
-                              doubling_time,
-                              cohort_fraction,
-                              los_matrix)
-    # print(icu_census_noncovid_mean)
+    census = project_census(n_days, starting_total, doubling_time, cohort_fraction, los_matrix,
+                            icu_census_covid_0, floor_census_covid_0,
+                            icu_census_noncovid_mean, floor_census_noncovid_mean,
+                            df_input_census, method)
+    df_result = records_frame(census, CENSUS_FIELDS)
+
+    return df_result
+
+
+# simulation methods: 'des' steps the simulators day by day,
+# 'convolution' (or 'direct'/'fft' to force the convolution) uses Convolution_Projector
+SIMULATION_METHODS = ['des', 'convolution', 'direct', 'fft']
+
+
+def _projector_method(method):
+    # convolution method of Convolution_Projector for a simulation method, None for 'des'
+    if method not in SIMULATION_METHODS:
+        raise ValueError('unknown simulation method: ' + str(method))
+    if method == 'des':
+        return None
+    return 'auto' if method == 'convolution' else method
+
+
+def project_census(n_days = 10,
+                   starting_total = 11,
+                   doubling_time = 6.2,
+                   cohort_fraction = [0.704, 0.13, 0.018, 0.13, 0.018],
+                   los_matrix = [[5, 0, 0],
+                                 [4, 9, 4],
+                                 [6, 9, 0],
+                                 [0, 9, 4],
+                                 [0, 11, 0]],
+                   icu_census_covid_0 = 2, floor_census_covid_0 = 2,
+                   icu_census_noncovid_mean = 67, floor_census_noncovid_mean = 86,
+                   input_census = None,
+                   method = 'des',
+                   admission_schedule = None):
+    '''
+    Numpy core of run_simulation, needs neither pandas nor a dataframe input
+        input_census: Input_Census (or input census dataframe), None to start from the covid census
+        admission_schedule: total admissions of each day from day 0 on (see growth_schedule),
+                            None for the growth of starting_total and doubling_time
+    Output: structured array of CENSUS_DTYPE, one record per observed and projected day
+    '''
+    projector_method = _projector_method(method)
+    if projector_method is None:
+        simulator = DES_Simulator(n_days,
+                                  starting_total,
+                                  doubling_time,
+                                  cohort_fraction,
+                                  los_matrix,
+                                  admission_schedule)
+    else:
+        simulator = Convolution_Projector(n_days,
+                                          starting_total,
+                                          doubling_time,
+                                          cohort_fraction,
+                                          los_matrix,
+                                          projector_method,
+                                          admission_schedule)
     simulator.state_init(icu_census_covid_0, floor_census_covid_0,
                          icu_census_noncovid_mean, floor_census_noncovid_mean,
-                         df_input_census)
+                         input_census)
     simulator.run()
-    df_result = simulator.save_census()
+    census = simulator.census()
+    return census[0] if census.ndim > 1 else census
+
+
+# parameters of a sweep scenario and their defaults, as in sensitivity_calculation
+SWEEP_DEFAULTS = dict([('icu_census_covid_0', 1), ('floor_census_covid_0', 1),
+                       ('icu_census_noncovid_mean', 67), ('floor_census_noncovid_mean', 80),
+                       ('starting_total', 11),
+                       ('doubling_time', 6.2)] +
+                      [('cohort_fraction_%d' % i, fraction) for i, fraction in enumerate([0.704, 0.13, 0.018, 0.13, 0.018])] +
+                      [('los_matrix_%d_%d' % (i, j), los) for i, row in enumerate([[5, 0, 0],
+                                                                                   [4, 9, 4],
+                                                                                   [6, 9, 0],
+                                                                                   [0, 9, 4],
+                                                                                   [0, 11, 0]])
+                                                           for j, los in enumerate(row)] +
+                      [('icu_capacity', 84), ('floor_capacity', 100), ('ventilator_capacity', 84),
+                       ('icu_non_covid_ventilator_percentage', 0.5)])
+
+
+def scenario_parameters(n_scenarios = 1, defaults = SWEEP_DEFAULTS, **parameters):
+    '''
+    dict of parameter name -> array with one value per scenario, for every name of defaults
+        parameters: a value shared by all scenarios or one value per scenario, the others take their defaults
+    '''
+    unknown = set(parameters) - set(defaults)
+    if unknown:
+        raise ValueError('unknown sweep parameters: ' + ', '.join(sorted(unknown)))
+    scenarios = {}
+    for name, default in defaults.items():
+        value = np.asarray(parameters.get(name, default))
+        scenarios[name] = value if value.ndim > 0 else np.full(n_scenarios, value)
+    return scenarios
 
-    return df_result
 
+def scenario_cohorts(scenarios):
+    '''
+    cohort_fraction [scenario, cohort] and los_matrix [scenario, cohort, stay]
+    from the cohort_fraction_i and los_matrix_i_j entries of a dict of per scenario arrays
+    '''
+    cohort_fraction = np.stack([scenarios['cohort_fraction_%d' % i] for i in range(5)], axis = 1)
+    los_matrix = np.stack([np.stack([scenarios['los_matrix_%d_%d' % (i, j)] for j in range(3)], axis = 1)
+                           for i in range(5)], axis = 1)
+    return cohort_fraction, los_matrix
 
+
+def scenario_simulator(scenarios, n_days, method = 'des', input_census = None):
+    '''
+    Batch_DES_Simulator ('des') or Convolution_Projector (the other SIMULATION_METHODS) of the scenarios
+    of scenario_parameters, initialized from their census parameters and input_census, not run yet
+    '''
+    projector_method = _projector_method(method)
+    cohort_fraction, los_matrix = scenario_cohorts(scenarios)
+    if projector_method is None:
+        simulator = Batch_DES_Simulator(n_days,
+                                        scenarios['starting_total'],
+                                        scenarios['doubling_time'],
+                                        cohort_fraction,
+                                        los_matrix)
+    else:
+        simulator = Convolution_Projector(n_days,
+                                          scenarios['starting_total'],
+                                          scenarios['doubling_time'],
+                                          cohort_fraction,
+                                          los_matrix,
+                                          projector_method)
+    simulator.state_init(scenarios['icu_census_covid_0'], scenarios['floor_census_covid_0'],
+                         scenarios['icu_census_noncovid_mean'], scenarios['floor_census_noncovid_mean'],
+                         input_census)
+    return simulator
+
+
+def _sweep_chunk(scenarios, df_input_census, n_days, method, store_path = None, start = 0):
+    '''
+    cap days of one chunk of sweep scenarios, all run as one batch
+    scenarios: dict of parameter name -> array with one value per scenario, for every name in SWEEP_DEFAULTS
+    store_path: Trajectory_Store that gets the census of the chunk from scenario start on
+    '''
+    simulator = scenario_simulator(scenarios, n_days, method, df_input_census)
+    cap_days = simulator.run_till_cap(scenarios['icu_capacity'], scenarios['floor_capacity'],
+                                      scenarios['ventilator_capacity'], scenarios['icu_non_covid_ventilator_percentage'])
+    if store_path is not None:
+        from trajectory_store import Trajectory_Store
+        with Trajectory_Store(store_path, 'r+') as store:
+            store.write_simulator(start, simulator)
+    return cap_days
+
+
+def sweep_cap_days(grid = None, points = None,
+                   input_census = None,
+                   n_days = MAX_SIMULATION_DAYS,
+                   n_workers = 1, chunk_size = 512,
+                   method = 'des',
+                   store = None,
+                   **base_parameters):
+    '''
+    Numpy core of parameter_sweep, same arguments with input_census for df_input_census
+    Output: structured array with the swept parameters and the icu/floor/ventilator cap days, one record per scenario
+    '''
+    _projector_method(method)
+    if grid is not None:
+        names = list(grid)
+        values = np.meshgrid(*[np.asarray(grid[name]) for name in names], indexing = 'ij')
+        swept = dict(zip(names, [value.ravel() for value in values]))
+    else:
+        swept = dict((name, np.asarray(points[name])) for name in points)
+    n_scenarios = len(next(iter(swept.values()))) if swept else 1
+    scenarios = scenario_parameters(n_scenarios, **dict(base_parameters, **swept))
+
+    store_path = None
+    if store is not None:
+        # the census of every scenario goes to the store, chunk by chunk
+        from trajectory_store import Trajectory_Store
+        n_input_days = 1 if input_census is None else len(_input_census_arrays(input_census).days)
+        store_path = store.path if isinstance(store, Trajectory_Store) else store
+        Trajectory_Store.create(store_path, n_scenarios, n_days + n_input_days, parameters = scenarios,
+                                metadata = {'n_days': n_days, 'n_input_days': n_input_days,
+                                            'method': method, 'swept': list(swept)}).close()
+
+    starts = range(0, n_scenarios, chunk_size)
+    chunks = [dict((name, value[start:start + chunk_size]) for name, value in scenarios.items()) for start in starts]
+    chunk_args = ([input_census] * len(chunks), [n_days] * len(chunks), [method] * len(chunks),
+                  [store_path] * len(chunks), starts)
+    if n_workers == 1 or len(chunks) == 1:
+        cap_days = list(map(_sweep_chunk, chunks, *chunk_args))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers = n_workers) as executor:
+            cap_days = list(executor.map(_sweep_chunk, chunks, *chunk_args))
+    cap_days = np.concatenate(cap_days)
+
+    records = np.empty(n_scenarios, dtype = [(name, value.dtype) for name, value in swept.items()] + CAP_DAYS_DTYPE.descr)
+    for name, value in swept.items():
+        records[name] = value
+    for ind, (field, _) in enumerate(CAP_DAYS_FIELDS):
+        records[field] = cap_days[:, ind]
+    return records
+
+
+def parameter_sweep(grid = None, points = None,
+                    df_input_census = None,
+                    n_days = MAX_SIMULATION_DAYS,
+                    n_workers = 1, chunk_size = 512,
+                    method = 'des',
+                    store = None,
+                    **base_parameters):
+    '''
+    Cap days over many scenarios of the sensitivity_calculation parameters (see SWEEP_DEFAULTS)
+        grid: dict of parameter name -> list of values, every combination is a scenario
+        points: alternatively a DataFrame or dict of equal length lists, one scenario per row
+        base_parameters: values of the parameters that are not swept
+    scenarios are run in batches of chunk_size, spread over a process pool when n_workers > 1
+    method: 'des' for Batch_DES_Simulator, 'convolution' (or 'direct'/'fft') for Convolution_Projector
+    store: path of a Trajectory_Store (see trajectory_store.py) to write the census of every scenario to,
+           with the parameters of the scenarios, instead of keeping the trajectories in memory
+    Output: dataframe with the swept parameters and ICU/Floor/Ventilator cap days, one row per scenario
+    '''
+    records = sweep_cap_days(grid, points, df_input_census, n_days, n_workers, chunk_size, method, store, **base_parameters)
+    swept_fields = [(name, name) for name in records.dtype.names[:-len(CAP_DAYS_FIELDS)]]
+    return records_frame(records, swept_fields + CAP_DAYS_FIELDS)
+
+
+# census changes and cap days of los perturbations, see los_sensitivity
+Los_Sensitivity = collections.namedtuple('Los_Sensitivity', ['cells', 'perturbations', 'icu_covid', 'floor_covid',
+                                                             'base_cap_days', 'cap_days', 'discrete_cap_days'])
+
+
+def los_sensitivity(input_census = None,
+                    perturbations = (-1, +1),
+                    cells = None,
+                    n_days = MAX_SIMULATION_DAYS,
+                    method = 'convolution',
+                    validate = False,
+                    **base_parameters):
+    '''
+    Effect of changing each los cell by each perturbation on the covid census and the cap days, in one pass
+        cells: [cell, (cohort, stay)] indices of the los cells, the nonzero cells by default
+        perturbations: los changes applied to each cell in turn
+        method: 'convolution', 'direct' or 'fft', as in project_census
+        validate: also simulate every perturbed los with Batch_DES_Simulator, as sensitivity_calculation does
+        base_parameters: the parameters of SWEEP_DEFAULTS
+    a los cell changes the starting tracker and the occupancy kernels, those of its cohort and, through the
+    longest los, of cohorts without any los, so the census change of every perturbation is the change of the
+    starting census decay, all computed as one batch, plus the admissions convolved with the kernel difference
+    summed over the cohorts, all convolved in one call
+    Output: Los_Sensitivity with the census changes icu_covid and floor_covid [perturbation, cell, day],
+            the cap days [(icu, floor, ventilator)] of the base and [perturbation, cell, (icu, floor, ventilator)]
+            of the perturbed los, and discrete_cap_days the same from the simulations when validate, else None
+    '''
+    if _projector_method(method) is None:
+        raise ValueError('los sensitivity needs a convolution method, not ' + str(method))
+    scenarios = scenario_parameters(**base_parameters)
+    base = scenario_simulator(scenarios, n_days, method, input_census)
+    cohort_fraction, los_matrix = base.cohort_fraction, base.los
+    cells = np.argwhere(los_matrix[0] > 0) if cells is None else np.asarray(cells, dtype = int).reshape(-1, 2)
+    perturbations = np.asarray(perturbations, dtype = int)
+
+    # census the starting tracker is seeded from, the last input day
+    icu_census_covid_0 = base.icu_covid_census[:, base.n_input_days - 1]
+    floor_census_covid_0 = base.floor_covid_census[:, base.n_input_days - 1]
+    base.run()
+
+    # los of the base, then of each perturbation of each cell
+    n_cells, n_perturbed = len(cells), len(perturbations) * len(cells)
+    cell_ind = np.tile(np.arange(n_cells), len(perturbations))
+    pa_ind, col_ind = cells[cell_ind, 0], cells[cell_ind, 1]
+    los = np.repeat(los_matrix, 1 + n_perturbed, axis = 0)
+    los[1 + np.arange(n_perturbed), pa_ind, col_ind] += np.repeat(perturbations, n_cells)
+    if np.any(los < 0):
+        raise ValueError('perturbed los below 0')
+    fraction = np.repeat(cohort_fraction, 1 + n_perturbed, axis = 0)
+
+    # change of the starting census decay
+    n_projected = base.n_days - base.n_input_days
+    tracker = _initial_tracker(los, fraction, icu_census_covid_0, floor_census_covid_0, np.max(los) + 1)
+    icu_decay, floor_decay = [np.sum(decay, axis = 1) for decay in _cohort_occupancy(los, tracker, n_projected)]
+
+    # change of the admitted census, the admissions convolved with the kernel difference of the cohorts
+    icu_kernel, floor_kernel = _admission_kernels(los)
+    weight = cohort_fraction[0][:, np.newaxis]
+    kernels = np.concatenate([np.sum((icu_kernel[1:] - icu_kernel[:1]) * weight, axis = 1),
+                              np.sum((floor_kernel[1:] - floor_kernel[:1]) * weight, axis = 1)])
+    admissions = np.repeat(base.generate_all_admissions(), 2 * n_perturbed, axis = 0)
+    growth = np.repeat(2**(1/base.doubling_time), 2 * n_perturbed)
+    icu_admitted, floor_admitted = np.split(_causal_convolve(admissions, kernels, growth, base.method), 2)
+
+    icu_change = np.zeros([n_perturbed, base.n_days])
+    floor_change = np.zeros([n_perturbed, base.n_days])
+    icu_change[:, base.n_input_days:] = icu_decay[1:] - icu_decay[:1] + icu_admitted
+    floor_change[:, base.n_input_days:] = floor_decay[1:] - floor_decay[:1] + floor_admitted
+
+    # first days over capacity of the base and of every perturbation, [scenario, (icu, floor, ventilator)]
+    icu_covid = np.concatenate([np.zeros([1, base.n_days]), icu_change]) + base.icu_covid_census
+    floor_covid = np.concatenate([np.zeros([1, base.n_days]), floor_change]) + base.floor_covid_census
+    vent_percent = scenarios['icu_non_covid_ventilator_percentage'][0]
+    cap_days = np.stack([_first_exceedance(icu_covid + base.icu_noncovid_census, scenarios['icu_capacity'], base.n_input_days, base.n_days),
+                         _first_exceedance(floor_covid + base.floor_noncovid_census, scenarios['floor_capacity'], base.n_input_days, base.n_days),
+                         _first_exceedance(icu_covid + base.icu_noncovid_census * vent_percent, scenarios['ventilator_capacity'], base.n_input_days, base.n_days)],
+                        axis = 1)
+
+    discrete_cap_days = None
+    if validate:
+        points = dict(('los_matrix_%d_%d' % (i, j), los[1:, i, j]) for i in range(los.shape[1]) for j in range(los.shape[2]))
+        records = sweep_cap_days(points = points, input_census = input_census, n_days = n_days, **base_parameters)
+        discrete_cap_days = np.stack([records[field] for field, _ in CAP_DAYS_FIELDS], axis = 1).reshape(len(perturbations), n_cells, 3)
+
+    return Los_Sensitivity(cells, perturbations,
+                           icu_change.reshape(len(perturbations), n_cells, -1),
+                           floor_change.reshape(len(perturbations), n_cells, -1),
+                           cap_days[0], cap_days[1:].reshape(len(perturbations), n_cells, 3),
+                           discrete_cap_days)
+
+
+@cached_result
 def sensitivity_calculation(
                     # n_days = 10,
                    df_input_census = None,
@@ -363,100 +1911,72 @@ def sensitivity_calculation(
                    icu_capacity = 84,
                    floor_capacity = 100,
                    ventilator_capacity = 84,
-                   icu_non_covid_ventilator_percentage = 0.5
+                   icu_non_covid_ventilator_percentage = 0.5,
+                   los_method = 'discrete'
                    ):
 
     '''
+    los_method: 'discrete' simulates each los perturbation, 'analytic' derives the base and los cap days
+                from one pass of los_sensitivity and projects the doubling times with Convolution_Projector
     Output: list of dataframes in the order:
         [df_base, df_doubling_time,
         df_los_minus_icu, df_los_minus_floor, df_los_minus_vent,
         df_los_plus_icu, df_los_plus_floor, df_los_plus_vent]
     '''
-    # parameter merge
-    cohort_fraction = [cohort_fraction_0, cohort_fraction_1, cohort_fraction_2, cohort_fraction_3, cohort_fraction_4]
-    los_matrix = [[los_matrix_0_0, los_matrix_0_1, los_matrix_0_2],
-                  [los_matrix_1_0, los_matrix_1_1, los_matrix_1_2],
-                  [los_matrix_2_0, los_matrix_2_1, los_matrix_2_2],
-                  [los_matrix_3_0, los_matrix_3_1, los_matrix_3_2],
-                  [los_matrix_4_0, los_matrix_4_1, los_matrix_4_2]]
+    if los_method not in ('discrete', 'analytic'):
+        raise ValueError('unknown los sensitivity method: ' + str(los_method))
+    base_parameters = dict((name, value) for name, value in locals().items() if name in SWEEP_DEFAULTS)
+    los_matrix_array = np.array([[los_matrix_0_0, los_matrix_0_1, los_matrix_0_2],
+                                 [los_matrix_1_0, los_matrix_1_1, los_matrix_1_2],
+                                 [los_matrix_2_0, los_matrix_2_1, los_matrix_2_2],
+                                 [los_matrix_3_0, los_matrix_3_1, los_matrix_3_2],
+                                 [los_matrix_4_0, los_matrix_4_1, los_matrix_4_2]])
+
+    # scenarios in order: base, doubling times, then los -1 and +1 on each nonzero cell
+    # simulated when discrete, the base and los cells of analytic come from los_sensitivity
+    dt_set = [doubling_time/2, doubling_time, doubling_time*2]
+    perturbations_set = [-1, +1]
+    perturbed_cells = np.argwhere(los_matrix_array > 0) # can be modified
+
+    n_base = 1 if los_method == 'discrete' else 0
+    n_los = len(perturbations_set) * len(perturbed_cells) if los_method == 'discrete' else 0
+    points = {'doubling_time': [doubling_time] * n_base + dt_set + [doubling_time] * n_los}
+    for i in range(los_matrix_array.shape[0]):
+        for j in range(los_matrix_array.shape[1]):
+            points['los_matrix_%d_%d' % (i, j)] = np.full(n_base + len(dt_set) + n_los, los_matrix_array[i, j])
+    k = n_base + len(dt_set)
+    for perturb in (perturbations_set if los_method == 'discrete' else []):
+        for i, j in perturbed_cells:
+            points['los_matrix_%d_%d' % (i, j)][k] += perturb
+            k += 1
+
+    records = sweep_cap_days(points = points, input_census = df_input_census,
+                             method = 'des' if los_method == 'discrete' else 'convolution', **base_parameters)
+    cap_days = np.stack([records[field] for field, _ in CAP_DAYS_FIELDS], axis = 1)
+    if los_method == 'analytic':
+        sensitivity = los_sensitivity(df_input_census, perturbations_set, perturbed_cells, **base_parameters)
+        cap_days = np.concatenate([sensitivity.base_cap_days[np.newaxis], cap_days, sensitivity.cap_days.reshape(-1, 3)])
 
     # base case
-    simulator = DES_Simulator(MAX_SIMULATION_DAYS,
-                              starting_total,
-                              doubling_time,
-                              cohort_fraction,
-                              los_matrix)
-    simulator.state_init(icu_census_covid_0, floor_census_covid_0,
-                         icu_census_noncovid_mean, floor_census_noncovid_mean,
-                         df_input_census)
-    cap_days = simulator.run_till_cap(icu_capacity, floor_capacity, ventilator_capacity,
-                                        icu_non_covid_ventilator_percentage)
-    df_base = pd.DataFrame([cap_days], columns = [COL_ICU_CAP_DAYS, COL_FLOOR_CAP_DAYS, COL_VENTILATOR_CAP_DAYS])
-    # print(df_base)
-    # df_base.to_csv('sensitivity_base.csv')
+    pd = _pandas()
+    df_base = pd.DataFrame(cap_days[:1], columns = [COL_ICU_CAP_DAYS, COL_FLOOR_CAP_DAYS, COL_VENTILATOR_CAP_DAYS])
 
     # sensitivity of doubling time
-    df_doubling_time = pd.DataFrame(columns = [COL_DOUBLING_TIME, COL_ICU_CAP_DAYS, COL_FLOOR_CAP_DAYS])
-    dt_set = [doubling_time/2, doubling_time, doubling_time*2]
-    df_doubling_time[COL_DOUBLING_TIME] = np.array(dt_set)
-    for dt in dt_set:
-        simulator = DES_Simulator(MAX_SIMULATION_DAYS,
-                                  starting_total,
-                                  dt,
-                                  cohort_fraction,
-                                  los_matrix)
-        simulator.state_init(icu_census_covid_0, floor_census_covid_0,
-                             icu_census_noncovid_mean, floor_census_noncovid_mean,
-                             df_input_census)
-        cap_days = simulator.run_till_cap(icu_capacity, floor_capacity, ventilator_capacity,
-                                            icu_non_covid_ventilator_percentage)
-        df_doubling_time.loc[df_doubling_time[COL_DOUBLING_TIME] == dt, COL_ICU_CAP_DAYS] = cap_days[0]
-        df_doubling_time.loc[df_doubling_time[COL_DOUBLING_TIME] == dt, COL_FLOOR_CAP_DAYS] = cap_days[1]
-        df_doubling_time.loc[df_doubling_time[COL_DOUBLING_TIME] == dt, COL_VENTILATOR_CAP_DAYS] = cap_days[2]
-    # print(df_doubling_time)
-    # df_doubling_time.to_csv('sensitivity_dt.csv')
+    df_doubling_time = pd.DataFrame(cap_days[1:1 + len(dt_set)], columns = [COL_ICU_CAP_DAYS, COL_FLOOR_CAP_DAYS, COL_VENTILATOR_CAP_DAYS])
+    df_doubling_time.insert(0, COL_DOUBLING_TIME, np.array(dt_set))
 
     # sensitivity los
-    perturbations_set = [-1, +1]
-    file_name_set = ['minus', 'plus']
     result_list = [df_base, df_doubling_time]
-    for perturb, file_name in zip(perturbations_set, file_name_set):
-        los_matrix_array = np.array(los_matrix)
-        df_los_icu = np.zeros(los_matrix_array.shape) - 1
-        df_los_floor = np.zeros(los_matrix_array.shape) - 1
-        df_los_vent = np.zeros(los_matrix_array.shape) - 1
-        n_row, n_col = df_los_icu.shape
-        for i in range(n_row):
-            for j in range(n_col):
-                if los_matrix_array[i, j] > 0: # can be modified
-                    los_matrix_array[i, j] += perturb
-                    simulator = DES_Simulator(MAX_SIMULATION_DAYS,
-                                              starting_total,
-                                              doubling_time,
-                                              cohort_fraction,
-                                              los_matrix_array.tolist())
-                    simulator.state_init(icu_census_covid_0, floor_census_covid_0,
-                                         icu_census_noncovid_mean, floor_census_noncovid_mean,
-                                         df_input_census)
-                    cap_days = simulator.run_till_cap(icu_capacity, floor_capacity, ventilator_capacity,
-                                                        icu_non_covid_ventilator_percentage)
-                    df_los_icu[i,j] = cap_days[0]
-                    df_los_floor[i,j] = cap_days[1]
-                    df_los_vent[i, j] = cap_days[2]
-                    los_matrix_array[i, j] -= perturb
-        df_los_icu[df_los_icu<0] = None
-        df_los_floor[df_los_floor<0] = None
-        df_los_vent[df_los_vent<0] = None
-        df_los_icu = pd.DataFrame(df_los_icu)
-        df_los_floor = pd.DataFrame(df_los_floor)
-        df_los_vent = pd.DataFrame(df_los_vent)
-        result_list += [df_los_icu, df_los_floor, df_los_vent]
-        # df_los_icu.to_csv('sensitivity_los_'+file_name+'_icu.csv')
-        # df_los_floor.to_csv('sensitivity_los_'+file_name+'_floor.csv')
-        # df_los_vent.to_csv('sensitivity_los_'+file_name+'_ventilator.csv')
-        # print(df_los_icu)
-        # print(df_los_floor)
-        # print(df_los_vent)
+    n_cells = len(perturbed_cells)
+    for k in range(len(perturbations_set)):
+        los_cap_days = cap_days[1 + len(dt_set) + k * n_cells:][:n_cells]
+        df_los_icu = np.full(los_matrix_array.shape, np.nan)
+        df_los_floor = np.full(los_matrix_array.shape, np.nan)
+        df_los_vent = np.full(los_matrix_array.shape, np.nan)
+        df_los_icu[tuple(perturbed_cells.T)] = los_cap_days[:, 0]
+        df_los_floor[tuple(perturbed_cells.T)] = los_cap_days[:, 1]
+        df_los_vent[tuple(perturbed_cells.T)] = los_cap_days[:, 2]
+        result_list += [pd.DataFrame(df_los_icu), pd.DataFrame(df_los_floor), pd.DataFrame(df_los_vent)]
     return result_list
 
 def arrival_fitting(df_new = None, fit_threshold = 4, use_past_n_days = 7):
@@ -468,6 +1988,7 @@ def arrival_fitting(df_new = None, fit_threshold = 4, use_past_n_days = 7):
     # df_new[COL_DATE] = [base + datetime.timedelta(days = i) for i in range(20)]
     # df_new[COL_DAILY_NEW_COVID_ADMISSION] = None
     # df_new.to_csv('daily_new_covid_admission.csv')
+    pd = _pandas()
     if df_new is not None:
         df_new[COL_DAY] = np.arange(len(df_new))
         df_new = df_new.dropna(subset = [COL_CUM_COVID_ADMISSION])
@@ -524,6 +2045,53 @@ def arrival_fitting(df_new = None, fit_threshold = 4, use_past_n_days = 7):
 
 
 
+def _window_sums(values, window):
+    # sums over the trailing window of the last axis, from cumulative sums
+    cum_values = np.cumsum(values, axis = -1)
+    cum_values[..., window:] = cum_values[..., window:] - cum_values[..., :-window].copy()
+    return cum_values
+
+
+def rolling_doubling_time(cum_admissions, window = 7, fit_threshold = 4):
+    '''
+    Log2-linear fits of cumulative admissions for every trailing window, of one or many series at once
+        cum_admissions: [day] or [series, day] cumulative admissions, nan where missing
+    the fit ending on day t uses days t - window + 1 .. t with more than fit_threshold admissions,
+    so the fit on the last non empty day is the one of arrival_fitting(use_past_n_days = window)
+    Output: dict of arrays shaped like cum_admissions, nan where there are too few points:
+        n_points, slope, intercept, doubling_time, first_day_admissions (2**intercept),
+        slope_se, intercept_se, doubling_time_se (standard errors, from the residuals)
+    '''
+    cum_admissions = np.asarray(cum_admissions, dtype = float)
+    used = (cum_admissions > fit_threshold).astype(float)
+    x = np.arange(cum_admissions.shape[-1]) * used
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        y = np.where(used > 0, np.log2(cum_admissions), 0)
+
+        # sufficient statistics of each window
+        n = _window_sums(used, window)
+        sum_x, sum_y = _window_sums(x, window), _window_sums(y, window)
+        mean_x, mean_y = sum_x / n, sum_y / n
+        sxx = _window_sums(x * x, window) - sum_x * mean_x
+        sxy = _window_sums(x * y, window) - sum_x * mean_y
+        syy = _window_sums(y * y, window) - sum_y * mean_y
+
+        slope = np.where(n >= 2, sxy / sxx, np.nan)
+        intercept = mean_y - slope * mean_x
+        residual_variance = np.where(n >= 3, np.maximum(syy - slope * sxy, 0) / (n - 2), np.nan)
+        slope_se = np.sqrt(residual_variance / sxx)
+        intercept_se = np.sqrt(residual_variance * (1 / n + mean_x**2 / sxx))
+
+        return {'n_points': n.astype(int),
+                'slope': slope,
+                'intercept': intercept,
+                'doubling_time': 1 / slope,
+                'first_day_admissions': 2**intercept,
+                'slope_se': slope_se,
+                'intercept_se': intercept_se,
+                'doubling_time_se': slope_se / slope**2}
+
+
 def test_df_convert(input_table):
     # test run: df = test_df_convert(input_table)
     # df = input_table
@@ -0,0 +1,178 @@
+import inspect
+
+import numpy as np
+import pandas as pd
+
+from des_simulator import (COL_DAY, COL_CENSUS_ICU_COVID, COL_CENSUS_ICU_NONCOVID,
+                           COL_CENSUS_FLOOR_COVID, COL_CENSUS_FLOOR_NONCOVID,
+                           SWEEP_DEFAULTS, SIMULATION_METHODS,
+                           run_simulation, read_input_census, check_input_census,
+                           scenario_parameters, scenario_cohorts, scenario_simulator)
+
+'''
+Projection of every facility of a health system in one call
+facilities with the same number of observed and projected days are simulated as one batch,
+and all results are streamed to a single csv or parquet file
+'''
+
+COL_FACILITY = 'Facility'
+COL_ERROR = 'Error'
+COL_N_DAYS = 'n_days'
+
+# parameters of a facility projection and their defaults, as in run_simulation
+PROJECTION_DEFAULTS = dict((name, parameter.default)
+                           for name, parameter in inspect.signature(run_simulation).parameters.items()
+                           if name in SWEEP_DEFAULTS)
+
+
+class Census_Writer():
+    '''
+    Appends census tables to one csv file, or one parquet file when the path ends with .parquet (needs pyarrow)
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.is_parquet = str(path).endswith('.parquet')
+        self.writer = None
+        self.n_rows = 0
+
+    def write(self, df_census):
+        if self.is_parquet:
+            import pyarrow as pa # optional, only needed for parquet output
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df_census, preserve_index = False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        else:
+            if self.writer is None:
+                self.writer = open(self.path, 'w', newline = '')
+            df_census.to_csv(self.writer, header = self.n_rows == 0, index = False)
+        self.n_rows += len(df_census)
+        return None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _facility_errors(scenarios, facility_days):
+    '''
+    reason each facility cannot be simulated, None when its parameters are valid
+    scenarios: dict of parameter name -> array with one value per facility, NaN where a value is not a number
+    facility_days: number of days of each facility, NaN where it is not a number
+    '''
+    cohort_fraction, los_matrix = scenario_cohorts(scenarios)
+    values = np.stack([np.asarray(value, dtype = float) for value in scenarios.values()], axis = 1)
+    checks = [(~np.all(np.isfinite(values), axis = 1), 'parameters must be finite numbers'),
+              (~(facility_days > 0) | (facility_days != np.round(facility_days)), COL_N_DAYS + ' must be a positive whole number'),
+              (scenarios['doubling_time'] <= 0, 'doubling_time must be positive'),
+              (scenarios['starting_total'] < 0, 'starting_total must not be negative'),
+              (np.any(cohort_fraction < 0, axis = 1), 'cohort fractions must not be negative'),
+              (np.any((los_matrix < 0) | (los_matrix != np.round(los_matrix)), axis = (1, 2)), 'los must be whole days')]
+    errors = np.full(len(values), None, dtype = object)
+    for failed, message in reversed(checks):
+        errors[failed] = message
+    return errors
+
+
+def _census_frame(facility_ids, simulator, facility_col):
+    # long table of every simulated facility, built from the census arrays at once
+    n_days = simulator.n_days
+    return pd.DataFrame({facility_col: np.repeat(facility_ids, n_days),
+                         COL_DAY: np.tile(np.arange(n_days), len(facility_ids)),
+                         COL_CENSUS_ICU_COVID: simulator.icu_covid_census.ravel(),
+                         COL_CENSUS_ICU_NONCOVID: simulator.icu_noncovid_census.ravel(),
+                         COL_CENSUS_FLOOR_COVID: simulator.floor_covid_census.ravel(),
+                         COL_CENSUS_FLOOR_NONCOVID: simulator.floor_noncovid_census.ravel()})
+
+
+def _simulate(scenarios, input_census, n_days, method):
+    simulator = scenario_simulator(scenarios, n_days, method, input_census)
+    simulator.run()
+    return simulator
+
+
+def run_facility_batch(df_parameters, input_census = None,
+                       output_path = 'facility_census.csv',
+                       facility_col = COL_FACILITY,
+                       n_days = 10,
+                       batch_size = 1000,
+                       method = 'des'):
+    '''
+    Project every facility of df_parameters and stream the census to output_path
+        df_parameters: one row per facility, facility_col plus any run_simulation parameter
+                       (missing ones take the run_simulation defaults) and optionally an n_days column
+        input_census: dict of facility id -> census dataframe or Input_Census, or a csv/parquet path
+                      read with read_input_census(facility_col = facility_col); facilities without
+                      a census start from icu_census_covid_0 and floor_census_covid_0, facilities whose
+                      census has invalid values or gaps in its days or dates are reported as errors
+        method: 'des' for Batch_DES_Simulator, 'convolution' (or 'direct'/'fft') for Convolution_Projector
+    facilities with the same number of observed and projected days run together, batch_size at a time
+    Output: dataframe of the facilities that could not be projected and why, the others are in output_path
+    '''
+    if method not in SIMULATION_METHODS:
+        raise ValueError('unknown simulation method: ' + str(method))
+    census_errors = {}
+    if input_census is not None and not isinstance(input_census, dict):
+        input_census = read_input_census(input_census, facility_col = facility_col, errors = census_errors)
+    input_census = {} if input_census is None else input_census
+
+    facility_ids = df_parameters[facility_col].to_numpy()
+    n_facilities = len(facility_ids)
+    # values that are not numbers become NaN, reported per facility
+    scenarios = scenario_parameters(n_facilities, PROJECTION_DEFAULTS,
+                                    **dict((name, pd.to_numeric(df_parameters[name], errors = 'coerce').to_numpy(dtype = float))
+                                           for name in PROJECTION_DEFAULTS if name in df_parameters.columns))
+    facility_days = (pd.to_numeric(df_parameters[COL_N_DAYS], errors = 'coerce').to_numpy(dtype = float)
+                     if COL_N_DAYS in df_parameters.columns else np.full(n_facilities, n_days, dtype = float))
+    errors = _facility_errors(scenarios, facility_days)
+    facility_days = np.where([error is None for error in errors], facility_days, 0).astype(int)
+
+    # census of each facility, 0 input days for facilities starting from the parameters
+    facility_census = np.full(n_facilities, None, dtype = object)
+    n_input_days = np.zeros(n_facilities, dtype = int)
+    for ind, facility in enumerate(facility_ids):
+        if errors[ind] is None and facility in census_errors:
+            errors[ind] = census_errors[facility]
+        elif errors[ind] is None and facility in input_census:
+            try:
+                facility_census[ind] = check_input_census(input_census[facility], facility)
+                n_input_days[ind] = len(facility_census[ind].days)
+            except (ValueError, KeyError) as error:
+                errors[ind] = str(error)
+
+    with Census_Writer(output_path) as writer:
+        valid = np.flatnonzero([error is None for error in errors])
+        groups = pd.DataFrame({'input': n_input_days[valid], 'days': facility_days[valid]}).groupby(['input', 'days']).indices
+        for (group_input_days, group_days), group in groups.items():
+            members = valid[group]
+            for start in range(0, len(members), batch_size):
+                batch = members[start:start + batch_size]
+                try:
+                    batches = [batch]
+                    simulators = [_simulate(dict((name, value[batch]) for name, value in scenarios.items()),
+                                            list(facility_census[batch]) if group_input_days > 0 else None,
+                                            group_days, method)]
+                except Exception:
+                    # isolate the facilities that fail
+                    batches, simulators = [], []
+                    for ind in batch:
+                        try:
+                            simulators.append(_simulate(dict((name, value[[ind]]) for name, value in scenarios.items()),
+                                                        [facility_census[ind]] if group_input_days > 0 else None,
+                                                        group_days, method))
+                            batches.append([ind])
+                        except Exception as error:
+                            errors[ind] = '%s: %s' % (type(error).__name__, error)
+                for batch, simulator in zip(batches, simulators):
+                    writer.write(_census_frame(facility_ids[batch], simulator, facility_col))
+
+    failed = np.flatnonzero([error is not None for error in errors])
+    return pd.DataFrame({facility_col: facility_ids[failed], COL_ERROR: errors[failed]})
@@ -0,0 +1,229 @@
+import collections
+
+import numpy as np
+
+from des_simulator import _scenario_array, _n_scenarios, _admission_totals
+
+'''
+Cohort paths declared as data
+a pathway is a fraction of the admissions and its steps, each a stay of los days in one unit;
+all pathways compile into one sparse transition operator over the states (pathway step, remaining los),
+and each day is one sparse product, so that more units and pathways only add nonzero states
+'''
+
+# one stay of a pathway, seeded steps share the census of their unit at the start of the simulation
+Pathway_Step = collections.namedtuple('Pathway_Step', ['unit', 'los', 'seeded'], defaults = [True])
+Pathway = collections.namedtuple('Pathway', ['name', 'fraction', 'steps'])
+
+# units and stays of the los_matrix columns of DES_Simulator, the second floor stay is not seeded
+LEGACY_STAY_UNITS = ['floor', 'icu', 'floor']
+LEGACY_SEEDED_STAYS = [True, True, False]
+
+
+def pathway(name, fraction, steps):
+    '''
+    Pathway from steps given as (unit, los) or (unit, los, seeded) tuples, steps are seeded by default
+    '''
+    return Pathway(name, fraction, [Pathway_Step(*step) for step in steps])
+
+
+def legacy_pathways(cohort_fraction = [0.704, 0.13, 0.018, 0.13, 0.018],
+                    los_matrix = [[5, 0, 0],
+                                  [4, 9, 4],
+                                  [6, 9, 0],
+                                  [0, 9, 4],
+                                  [0, 11, 0]]):
+    # the cohorts of DES_Simulator as pathways over the floor and icu units
+    return [pathway('cohort_%d' % pa_ind, fraction,
+                    [(unit, los, seeded) for unit, los, seeded in zip(LEGACY_STAY_UNITS, los_row, LEGACY_SEEDED_STAYS)])
+            for pa_ind, (fraction, los_row) in enumerate(zip(cohort_fraction, los_matrix))]
+
+
+class Sparse_Operator():
+    '''
+    Sparse square matrix in coordinate form, y[row] += weight * x[col] for each entry
+    applied to a vector [state] or to a batch [scenario, state]
+    '''
+    __slots__ = ('rows', 'cols', 'weights', 'n_states')
+
+    def __init__(self, rows, cols, weights, n_states):
+        self.rows = np.asarray(rows, dtype = np.intp)
+        self.cols = np.asarray(cols, dtype = np.intp)
+        self.weights = np.asarray(weights, dtype = float)
+        self.n_states = n_states
+
+    def dot(self, x):
+        if x.ndim == 1:
+            return np.bincount(self.rows, weights = x[self.cols] * self.weights, minlength = self.n_states)
+        # one bincount over the flattened batch, row offsets keep the scenarios apart
+        n_scenarios = x.shape[0]
+        rows = (np.arange(n_scenarios)[:, np.newaxis] * self.n_states + self.rows).ravel()
+        return np.bincount(rows, weights = (x[:, self.cols] * self.weights).ravel(),
+                           minlength = n_scenarios * self.n_states).reshape(n_scenarios, self.n_states)
+
+
+class Pathway_Operator():
+    '''
+    Pathways compiled into states, one per (pathway step, remaining los), with
+        transition: Sparse_Operator of the daily update, remaining los r > 0 goes to r - 1,
+                    r = 0 goes to the last day of the next step, or is discharged after the last step
+        admission_states: state of the first day of each pathway, its first step at remaining los - 1
+        state_unit: unit of each state, for the unit census
+    steps with a zero los are skipped, as stays with a zero los in DES_Simulator
+    '''
+    def __init__(self, pathways, units = None):
+        pathways = [pathway(*declared) for declared in pathways]
+        steps = [(pa_ind, step) for pa_ind, declared in enumerate(pathways) for step in declared.steps if step.los > 0]
+        if len(set(pa_ind for pa_ind, _ in steps)) < len(pathways):
+            raise ValueError('every pathway needs a step with a positive los')
+        if any(step.los != int(step.los) for _, step in steps):
+            raise ValueError('pathway los must be whole days')
+        self.units = list(units) if units is not None else list(collections.OrderedDict.fromkeys(step.unit for _, step in steps))
+        unknown = set(step.unit for _, step in steps) - set(self.units)
+        if unknown:
+            raise ValueError('unknown pathway units: ' + ', '.join(sorted(unknown)))
+
+        self.pathways = pathways
+        self.n_pathways = len(pathways)
+        self.n_units = len(self.units)
+        self.fraction = np.array([declared.fraction for declared in pathways], dtype = float)
+
+        # steps, [step]
+        self.step_pathway = np.array([pa_ind for pa_ind, _ in steps], dtype = np.intp)
+        self.step_unit = np.array([self.units.index(step.unit) for _, step in steps], dtype = np.intp)
+        self.step_los = np.array([step.los for _, step in steps], dtype = np.intp)
+        self.step_seeded = np.array([step.seeded for _, step in steps], dtype = bool)
+        self.step_offset = np.concatenate([[0], np.cumsum(self.step_los)[:-1]])
+        self.n_states = int(np.sum(self.step_los))
+
+        # states, [state], remaining los counts up within each step
+        self.state_step = np.repeat(np.arange(len(steps)), self.step_los)
+        self.state_remaining_los = np.arange(self.n_states) - self.step_offset[self.state_step]
+        self.state_unit = self.step_unit[self.state_step]
+
+        # a step is followed by the next step of the same pathway
+        has_next = np.append(self.step_pathway[1:] == self.step_pathway[:-1], False)
+        staying = np.flatnonzero(self.state_remaining_los > 0)
+        leaving = self.step_offset[has_next]
+        entering = self.step_offset[1:][has_next[:-1]] + self.step_los[1:][has_next[:-1]] - 1
+        self.transition = Sparse_Operator(np.concatenate([staying - 1, entering]),
+                                          np.concatenate([staying, leaving]),
+                                          np.ones(len(staying) + len(leaving)),
+                                          self.n_states)
+
+        first_step = np.flatnonzero(np.append(True, self.step_pathway[1:] != self.step_pathway[:-1]))
+        self.admission_states = self.step_offset[first_step] + self.step_los[first_step] - 1
+
+    def initial_counts(self, census_0, fraction):
+        '''
+        evenly distributed patients, the same rule as DES_Simulator.state_init:
+        the census of a unit is shared by its seeded steps in proportion to fraction * los,
+        and spread evenly over the remaining los of each step
+        census_0: [scenario, unit], fraction: [scenario, pathway]
+        returns [scenario, state]
+        '''
+        weight = fraction[:, self.step_pathway] * self.step_los * self.step_seeded
+        unit_weight = weight @ (self.step_unit[:, np.newaxis] == np.arange(self.n_units))
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            per_day = census_0[:, self.step_unit] * weight / unit_weight[:, self.step_unit] / self.step_los
+        per_day = np.where(weight > 0, per_day, 0)
+        return per_day[:, self.state_step]
+
+    def advance(self, counts):
+        return self.transition.dot(counts)
+
+    def unit_census(self, counts):
+        # [scenario, unit], the same flattened bincount as Sparse_Operator.dot
+        n_scenarios = counts.shape[0]
+        units = (np.arange(n_scenarios)[:, np.newaxis] * self.n_units + self.state_unit).ravel()
+        return np.bincount(units, weights = counts.ravel(), minlength = n_scenarios * self.n_units).reshape(n_scenarios, self.n_units)
+
+
+class Pathway_Simulator():
+    '''
+    Batch simulation of the covid census of every unit over compiled pathways
+    starting_total, doubling_time and fraction are shared or given per scenario,
+    fraction defaults to the fractions of the pathways,
+    admission_schedule: total admissions of each day, [day] or [scenario, day] (see des_simulator.growth_schedule)
+    '''
+    def __init__(self, n_days = 10,
+                    starting_total = 10,
+                    doubling_time = 7,
+                    pathways = None,
+                    units = None,
+                    fraction = None,
+                    admission_schedule = None):
+        self.operator = Pathway_Operator(legacy_pathways() if pathways is None else pathways, units)
+        self.units = self.operator.units
+
+        self.n_input_days = 1
+        self.n_days = n_days + self.n_input_days
+        fraction = self.operator.fraction if fraction is None else fraction
+        self.n_scenarios = _n_scenarios((starting_total, 0), (doubling_time, 0), (fraction, 1),
+                                        (admission_schedule, 1))
+
+        # parameters for new admission generator
+        self.starting_total = _scenario_array(starting_total, self.n_scenarios, 0)
+        self.doubling_time = _scenario_array(doubling_time, self.n_scenarios, 0)
+        self.fraction = _scenario_array(fraction, self.n_scenarios, 1)
+        self.admission_schedule = admission_schedule
+        # admissions [day, scenario, pathway] of the whole horizon, built when a run starts
+        self.admissions = None
+
+        # covid census [scenario, day, unit] and patients [scenario, state]
+        self.census = None
+        self.counts = None
+
+    def state_init(self, initial_census = None, observed_census = None):
+        '''
+        initial_census: covid census of each unit on the first day, dict of unit -> value,
+                        or [unit] / [scenario, unit], shared or per scenario
+        observed_census: alternatively the observed covid census [day, unit] or [scenario, day, unit],
+                         the simulation starts from its last day
+        '''
+        if observed_census is not None:
+            observed_census = np.asarray(observed_census, dtype = float)
+            self.n_input_days = observed_census.shape[-2]
+            self.n_days += (self.n_input_days-1) # current days + projected days
+            initial_census = observed_census[..., -1, :]
+        elif isinstance(initial_census, dict):
+            unknown = set(initial_census) - set(self.units)
+            if unknown:
+                raise ValueError('unknown pathway units: ' + ', '.join(sorted(unknown)))
+            initial_census = np.stack(np.broadcast_arrays(*[np.asarray(initial_census.get(unit, 0), dtype = float)
+                                                            for unit in self.units]), axis = -1)
+        elif initial_census is None:
+            initial_census = np.ones(len(self.units))
+        initial_census = _scenario_array(initial_census, self.n_scenarios, 1)
+
+        self.census = np.zeros([self.n_scenarios, self.n_days, len(self.units)])
+        if observed_census is not None:
+            self.census[:, :self.n_input_days] = observed_census
+        else:
+            self.census[:, 0] = initial_census
+        self.counts = self.operator.initial_counts(initial_census, self.fraction)
+
+    def run(self):
+
+        self.admissions = self.admission_matrix()
+        for day in range(self.n_input_days, self.n_days): # start from the next input day
+            self.counts = self.operator.advance(self.counts)
+            self.counts[:, self.operator.admission_states] += self.generate_new_admission(day)
+            self.census[:, day] = self.operator.unit_census(self.counts)
+
+        return None
+
+    def admission_matrix(self):
+        # new patients [day, scenario, pathway] of every day, same schedule as Batch_DES_Simulator
+        total_admission = _admission_totals(self.n_days, self.starting_total[:, np.newaxis],
+                                            self.doubling_time[:, np.newaxis], self.admission_schedule)
+        total_admission = np.broadcast_to(total_admission, (self.n_scenarios, self.n_days))
+        return total_admission.T[:, :, np.newaxis] * self.fraction
+
+    def generate_new_admission(self, day):
+        # [scenario, pathway]
+        return self.admissions[day]
+
+    def unit_census(self, unit):
+        # covid census [scenario, day] of one unit
+        return self.census[:, :, self.units.index(unit)]
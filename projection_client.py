@@ -0,0 +1,91 @@
+import datetime
+import json
+import urllib.error
+import urllib.request
+
+'''
+Thin client of projection_server.py, for app.R to call instead of sourcing des_simulator.py:
+    source_python("projection_client.py")
+    simulation_data <- run_simulation(n_days = as.integer(n_days_model), ...)
+the functions take the parameters of the des_simulator functions of the same name and return the same dataframes
+this module only needs pandas, and importing it starts nothing
+'''
+
+SERVER_URL = 'http://127.0.0.1:8765'
+REQUEST_TIMEOUT_SECONDS = 120
+
+# marker of an encoded dataframe in the json of requests and responses
+FRAME_KEY = '__dataframe__'
+
+
+def _json_value(value):
+    # numpy scalars and dates as plain json values
+    if hasattr(value, 'item'):
+        return value.item()
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError('cannot encode ' + type(value).__name__ + ' as json')
+
+
+def encode(value):
+    '''
+    json-ready form of a value, dataframes become {FRAME_KEY: {'columns': [...], 'values': [[column values], ...]}}
+    so that columns keep their names and order (the los tables of sensitivity_calculation have integer names)
+    '''
+    if hasattr(value, 'to_numpy') and hasattr(value, 'columns'):
+        return {FRAME_KEY: {'columns': [encode(column) for column in value.columns],
+                            'values': [value[column].to_numpy().tolist() for column in value.columns]}}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, encode(item)) for key, item in value.items())
+    return value
+
+
+def decode(value):
+    # inverse of encode, dataframes are rebuilt with pandas
+    if isinstance(value, dict) and FRAME_KEY in value:
+        import pandas as pd
+        frame = value[FRAME_KEY]
+        df = pd.DataFrame(dict(enumerate(frame['values'])), columns = range(len(frame['columns'])))
+        df.columns = frame['columns']
+        return df
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, decode(item)) for key, item in value.items())
+    return value
+
+
+def request_projection(function_name, server_url = SERVER_URL, timeout = REQUEST_TIMEOUT_SECONDS, **parameters):
+    '''
+    POST the parameters of function_name to the server and decode its result
+    raises RuntimeError with the server's message when the projection fails
+    '''
+    body = json.dumps(encode(parameters), default = _json_value).encode()
+    request = urllib.request.Request(server_url.rstrip('/') + '/' + function_name, data = body,
+                                     headers = {'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout = timeout) as response:
+            return decode(json.loads(response.read()))
+    except urllib.error.HTTPError as error:
+        message = json.loads(error.read() or b'{}').get('error', error.reason)
+        raise RuntimeError('projection server: ' + str(message))
+
+
+def run_simulation(**parameters):
+    return request_projection('run_simulation', **parameters)
+
+
+def sensitivity_calculation(**parameters):
+    return request_projection('sensitivity_calculation', **parameters)
+
+
+def arrival_fitting(df_new = None, **parameters):
+    return request_projection('arrival_fitting', df_new = df_new, **parameters)
+
+
+def server_status(server_url = SERVER_URL, timeout = REQUEST_TIMEOUT_SECONDS):
+    # request counts of the server
+    with urllib.request.urlopen(server_url.rstrip('/') + '/health', timeout = timeout) as response:
+        return json.loads(response.read())
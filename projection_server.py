@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+
+import des_simulator
+from projection_client import encode, decode, _json_value
+
+'''
+Long-lived local projection server for the Shiny front end
+    python projection_server.py --port 8765 --workers 4
+POST /run_simulation, /sensitivity_calculation or /arrival_fitting with a json object of the parameters
+of the des_simulator function (dataframes encoded as in projection_client.encode), the response is the
+encoded result, or {"error": ...} with status 400; GET /health returns the request counts
+the worker processes keep des_simulator and pandas imported, and identical requests in flight share one projection
+'''
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 64 * 2**20
+
+ENTRY_POINTS = {'run_simulation': des_simulator.run_simulation,
+                'sensitivity_calculation': des_simulator.sensitivity_calculation,
+                'arrival_fitting': des_simulator.arrival_fitting}
+
+STATUS_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+def _warm_up():
+    # imported once per worker, not per request
+    des_simulator._pandas()
+    return None
+
+
+def _project(function_name, parameters):
+    # runs in a worker process, returns the encoded result or the error message
+    try:
+        return True, encode(ENTRY_POINTS[function_name](**decode(parameters)))
+    except Exception as error:
+        return False, '%s: %s' % (type(error).__name__, error)
+
+
+class Projection_Server():
+    '''
+    asyncio http server over a process pool, identical requests in flight are coalesced
+    '''
+    def __init__(self, host = DEFAULT_HOST, port = DEFAULT_PORT, n_workers = None):
+        self.host = host
+        self.port = port
+        self.n_workers = n_workers or os.cpu_count()
+        self.executor = None
+        self.server = None
+
+        # request key -> future of the projection
+        self.in_flight = {}
+        self.n_requests = 0
+        self.n_coalesced = 0
+        self.n_errors = 0
+
+    async def start(self):
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers = self.n_workers, initializer = _warm_up)
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        # port 0 picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+        return None
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown()
+        return None
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def status(self):
+        return {'requests': self.n_requests, 'coalesced': self.n_coalesced, 'errors': self.n_errors,
+                'in_flight': len(self.in_flight), 'workers': self.n_workers}
+
+    async def project(self, function_name, parameters):
+        '''
+        result of one request, shared with the identical requests that arrive before it is done
+        returns (ok, encoded result or error message)
+        '''
+        self.n_requests += 1
+        key = (function_name, json.dumps(parameters, sort_keys = True))
+        if key in self.in_flight:
+            self.n_coalesced += 1
+            return await asyncio.shield(self.in_flight[key])
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, _project, function_name, parameters)
+        self.in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+
+    async def _respond(self, method, path, body):
+        # (status, json-ready payload) of one http request
+        name = path.split('?')[0].strip('/')
+        if name == 'health':
+            return 200, self.status()
+        if name not in ENTRY_POINTS:
+            return 404, {'error': 'unknown projection: ' + name}
+        if method != 'POST':
+            return 405, {'error': 'projections are requested with POST'}
+        try:
+            parameters = json.loads(body or b'{}')
+        except ValueError as error:
+            return 400, {'error': 'invalid json: ' + str(error)}
+        if not isinstance(parameters, dict):
+            return 400, {'error': 'parameters must be a json object'}
+
+        ok, result = await self.project(name, parameters)
+        if not ok:
+            self.n_errors += 1
+            return 400, {'error': result}
+        return 200, result
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1')
+                if line in ('\r\n', '\n', ''):
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                return
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_BYTES:
+                status, payload = 413, {'error': 'request body over %d bytes' % MAX_BODY_BYTES}
+            else:
+                body = await reader.readexactly(length) if length > 0 else b''
+                status, payload = await self._respond(request_line[0], request_line[1], body)
+
+            content = json.dumps(payload, default = _json_value).encode()
+            writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n'
+                          'Connection: close\r\n\r\n' % (status, STATUS_REASONS[status], len(content))).encode('latin-1'))
+            writer.write(content)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'local projection server for the Shiny front end')
+    parser.add_argument('--host', default = DEFAULT_HOST)
+    parser.add_argument('--port', type = int, default = DEFAULT_PORT)
+    parser.add_argument('--workers', type = int, default = None, help = 'worker processes, all cores by default')
+    args = parser.parse_args(argv)
+    asyncio.run(Projection_Server(args.host, args.port, args.workers).serve_forever())
+
+
+if __name__ == '__main__':
+    main()
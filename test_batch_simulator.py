@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from des_simulator import DES_Simulator, Batch_DES_Simulator
+
+'''
+Batch_DES_Simulator scenarios against DES_Simulator runs of the same parameters
+'''
+
+N_DAYS = 60
+COHORT_FRACTION = [0.704, 0.13, 0.018, 0.13, 0.018]
+LOS_MATRIX = [[5, 0, 0],
+              [4, 9, 4],
+              [6, 9, 0],
+              [0, 9, 4],
+              [0, 11, 0]]
+
+
+@pytest.mark.parametrize('empty_cohort', [None, 0, 2])
+def test_scenarios_match_des_simulator(empty_cohort):
+    # a cohort without any los, next to scenarios with longer stays than its own
+    los = np.array([LOS_MATRIX] * 4)
+    if empty_cohort is not None:
+        los[0, empty_cohort] = 0
+    los[1:, 1, 1] += [2, 5, 12]
+    doubling_time = np.array([6.2, 4, 9, 12])
+
+    batch = Batch_DES_Simulator(N_DAYS, 11, doubling_time, COHORT_FRACTION, los)
+    batch.state_init(1, 1, 67, 80)
+    batch.run()
+    for scenario in range(len(los)):
+        simulator = DES_Simulator(N_DAYS, 11, doubling_time[scenario], COHORT_FRACTION, los[scenario].tolist())
+        simulator.state_init(1, 1, 67, 80)
+        simulator.run()
+        for name in ['icu_covid_census', 'floor_covid_census']:
+            np.testing.assert_allclose(getattr(batch, name)[scenario], getattr(simulator, name), rtol = 1e-12)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from des_simulator import DES_Simulator, Batch_DES_Simulator, Input_Census
+
+'''
+Capacity_Index cap days against fresh run_till_cap runs of the same simulation
+'''
+
+N_DAYS = 60
+# capacities from already exceeded on the first projected day to never exceeded
+ICU_CAPS = [0, 70, 90, 130, 250, 1e9]
+FLOOR_CAPS = [0, 95, 120, 200, 400, 1e9]
+VENT_CAPS = [0, 40, 60, 100, 200, 1e9]
+VENT_PERCENTS = [0, 0.3, 0.5, 0.5, 0.8, 1]
+
+
+def _input_census(n_input_days):
+    rng = np.random.default_rng(n_input_days)
+    return Input_Census(np.arange(n_input_days),
+                        rng.integers(1, 20, n_input_days).astype(float), rng.integers(40, 70, n_input_days).astype(float),
+                        rng.integers(1, 30, n_input_days).astype(float), rng.integers(50, 90, n_input_days).astype(float))
+
+
+def _simulator(n_input_days):
+    simulator = DES_Simulator(N_DAYS, 11, 6.2)
+    simulator.state_init(2, 3, 67, 86, None if n_input_days is None else _input_census(n_input_days))
+    return simulator
+
+
+@pytest.mark.parametrize('n_input_days', [None, 1, 8])
+def test_matches_run_till_cap(n_input_days):
+    simulator = _simulator(n_input_days)
+    simulator.run()
+    index = simulator.capacity_index()
+    caps = np.array(np.meshgrid(ICU_CAPS, FLOOR_CAPS, VENT_CAPS, indexing = 'ij')).reshape(3, -1)
+    vent_percents = np.resize(VENT_PERCENTS, caps.shape[1])
+
+    cap_days = index.cap_days(caps[0], caps[1], caps[2], vent_percents)
+    assert cap_days.shape == (caps.shape[1], 3)
+    for ind in range(caps.shape[1]):
+        expected = _simulator(n_input_days).run_till_cap(caps[0, ind], caps[1, ind], caps[2, ind], vent_percents[ind])
+        np.testing.assert_array_equal(cap_days[ind], expected)
+    # never exceeded capacities give n_days, first projected day for those already exceeded
+    assert np.all(cap_days[caps[0] == 1e9, 0] == simulator.n_days)
+    assert np.all(cap_days[caps[0] == 0, 0] == simulator.n_input_days)
+
+
+def test_batch_scenario():
+    simulator = Batch_DES_Simulator(N_DAYS, [11, 4], [6.2, 9])
+    simulator.state_init([2, 5], [3, 1], 67, 86, _input_census(5))
+    simulator.run()
+    for scenario in range(2):
+        index = simulator.capacity_index(scenario)
+        cap_days = index.cap_days(ICU_CAPS, FLOOR_CAPS, VENT_CAPS, VENT_PERCENTS)
+        for ind in range(len(ICU_CAPS)):
+            fresh = Batch_DES_Simulator(N_DAYS, [11, 4][scenario], [6.2, 9][scenario])
+            fresh.state_init([2, 5][scenario], [3, 1][scenario], 67, 86, _input_census(5))
+            expected = fresh.run_till_cap(ICU_CAPS[ind], FLOOR_CAPS[ind], VENT_CAPS[ind], VENT_PERCENTS[ind])[0]
+            np.testing.assert_array_equal(cap_days[ind], expected)
@@ -0,0 +1,66 @@
+import io
+
+import numpy as np
+import pytest
+
+from des_simulator import DES_Simulator, Input_Census
+
+'''
+DES_Simulator checkpoints and warm starts against cold runs on the extended input census
+'''
+
+N_DAYS = 30
+N_APPENDED_DAYS = 20
+CENSUS_ARRAYS = ['icu_covid_census', 'icu_noncovid_census', 'floor_covid_census', 'floor_noncovid_census']
+
+
+def _observed_census(n_days, seed = 0):
+    rng = np.random.default_rng(seed)
+    return Input_Census(np.arange(n_days),
+                        rng.integers(1, 20, n_days).astype(float), rng.integers(40, 70, n_days).astype(float),
+                        rng.integers(1, 30, n_days).astype(float), rng.integers(50, 90, n_days).astype(float))
+
+
+def _first_days(census, n_days):
+    return Input_Census(*[field[:n_days] for field in census])
+
+
+def _cold_run(census):
+    simulator = DES_Simulator(N_DAYS, 11, 6.2)
+    simulator.state_init(2, 2, 67, 86, census)
+    simulator.run()
+    return simulator
+
+
+def test_warm_start_matches_cold_run():
+    census = _observed_census(1 + N_APPENDED_DAYS)
+    warm = DES_Simulator(N_DAYS, 11, 6.2)
+    warm.state_init(2, 2, 67, 86, _first_days(census, 1))
+    for n_observed in range(2, 2 + N_APPENDED_DAYS):
+        # each new day goes through a checkpoint, as between two sessions
+        checkpoint = io.BytesIO()
+        warm.save_checkpoint(checkpoint)
+        checkpoint.seek(0)
+        warm = DES_Simulator.load_checkpoint(checkpoint)
+        warm.observe_day(*[field[n_observed - 1] for field in census[1:]])
+        warm.run()
+
+        cold = _cold_run(_first_days(census, n_observed))
+        assert warm.n_days == cold.n_days
+        for name in CENSUS_ARRAYS:
+            np.testing.assert_array_equal(getattr(warm, name), getattr(cold, name))
+
+
+def test_checkpoint_round_trip(tmp_path):
+    simulator = _cold_run(_observed_census(5))
+    simulator.save_checkpoint(tmp_path / 'state.npz')
+    restored = DES_Simulator.load_checkpoint(tmp_path / 'state.npz')
+    assert restored.day == simulator.day
+    np.testing.assert_array_equal(restored.ch_tracker.to_array(), simulator.ch_tracker.to_array())
+    for name in CENSUS_ARRAYS:
+        np.testing.assert_array_equal(getattr(restored, name), getattr(simulator, name))
+
+
+def test_checkpoint_before_state_init():
+    with pytest.raises(ValueError):
+        DES_Simulator(N_DAYS).save_checkpoint(io.BytesIO())
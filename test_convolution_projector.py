@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from des_simulator import DES_Simulator, Batch_DES_Simulator, Convolution_Projector, Input_Census
+
+'''
+Convolution_Projector against the day by day simulators, on random los matrices and doubling times
+'''
+
+N_DAYS = 60
+N_SCENARIOS = 6
+CENSUS_ARRAYS = ['icu_covid_census', 'icu_noncovid_census', 'floor_covid_census', 'floor_noncovid_census']
+
+
+def _random_los(rng, n_scenarios):
+    # [scenario, cohort, stay], every cohort with at least one nonzero stay
+    los = rng.integers(0, 12, (n_scenarios, 5, 3))
+    los[..., 1] = np.where(np.all(los == 0, axis = 2), rng.integers(1, 12, (n_scenarios, 5)), los[..., 1])
+    return los
+
+
+def _random_fraction(rng, n_scenarios):
+    fraction = rng.uniform(0.01, 1, (n_scenarios, 5))
+    return fraction / np.sum(fraction, axis = 1, keepdims = True)
+
+
+def _input_census(rng, n_input_days):
+    return Input_Census(np.arange(n_input_days),
+                        rng.integers(1, 20, n_input_days).astype(float), rng.integers(40, 70, n_input_days).astype(float),
+                        rng.integers(1, 30, n_input_days).astype(float), rng.integers(50, 90, n_input_days).astype(float))
+
+
+def _assert_census_close(expected, actual, scenario = slice(None)):
+    for name in CENSUS_ARRAYS:
+        expected_census, actual_census = getattr(expected, name), getattr(actual, name)[scenario]
+        np.testing.assert_allclose(actual_census, expected_census, rtol = 1e-9,
+                                   atol = 1e-9 * max(np.max(np.abs(expected_census)), 1))
+
+
+@pytest.mark.parametrize('method', ['direct', 'fft', 'auto'])
+@pytest.mark.parametrize('n_input_days', [None, 1, 9])
+@pytest.mark.parametrize('seed', range(4))
+def test_matches_des_simulator(method, n_input_days, seed):
+    rng = np.random.default_rng(seed)
+    starting_total, doubling_time = rng.uniform(1, 50), rng.uniform(2, 20)
+    cohort_fraction, los_matrix = _random_fraction(rng, 1)[0], _random_los(rng, 1)[0]
+    input_census = None if n_input_days is None else _input_census(rng, n_input_days)
+
+    simulator = DES_Simulator(N_DAYS, starting_total, doubling_time, cohort_fraction.tolist(), los_matrix.tolist())
+    simulator.state_init(3, 5, 67, 86, input_census)
+    simulator.run()
+    projector = Convolution_Projector(N_DAYS, starting_total, doubling_time, cohort_fraction, los_matrix, method)
+    projector.state_init(3, 5, 67, 86, input_census)
+    projector.run()
+
+    _assert_census_close(simulator, projector, 0)
+
+
+@pytest.mark.parametrize('method', ['direct', 'fft', 'auto'])
+@pytest.mark.parametrize('n_input_days', [None, 9])
+@pytest.mark.parametrize('seed', range(4))
+def test_matches_batch_simulator(method, n_input_days, seed):
+    rng = np.random.default_rng(100 + seed)
+    starting_total = rng.uniform(1, 50, N_SCENARIOS)
+    doubling_time = rng.uniform(2, 20, N_SCENARIOS)
+    cohort_fraction, los_matrix = _random_fraction(rng, N_SCENARIOS), _random_los(rng, N_SCENARIOS)
+    input_census = None if n_input_days is None else _input_census(rng, n_input_days)
+    icu_census_covid_0 = rng.uniform(0, 10, N_SCENARIOS)
+    floor_census_covid_0 = rng.uniform(0, 10, N_SCENARIOS)
+
+    simulator = Batch_DES_Simulator(N_DAYS, starting_total, doubling_time, cohort_fraction, los_matrix)
+    simulator.state_init(icu_census_covid_0, floor_census_covid_0, 67, 86, input_census)
+    simulator.run()
+    projector = Convolution_Projector(N_DAYS, starting_total, doubling_time, cohort_fraction, los_matrix, method)
+    projector.state_init(icu_census_covid_0, floor_census_covid_0, 67, 86, input_census)
+    projector.run()
+
+    _assert_census_close(simulator, projector)
+
+
+@pytest.mark.parametrize('method', ['direct', 'fft'])
+def test_empty_cohorts_match_batch_simulator(method):
+    # cohorts without any los stay on the floor for their scenario's longest los
+    rng = np.random.default_rng(7)
+    los_matrix = _random_los(rng, N_SCENARIOS)
+    los_matrix[[0, 1, 1, 4], [0, 2, 4, 3]] = 0
+    cohort_fraction = _random_fraction(rng, N_SCENARIOS)
+    input_census = _input_census(rng, 9)
+
+    simulator = Batch_DES_Simulator(N_DAYS, 11, 6.2, cohort_fraction, los_matrix)
+    simulator.state_init(3, 5, 67, 86, input_census)
+    simulator.run()
+    projector = Convolution_Projector(N_DAYS, 11, 6.2, cohort_fraction, los_matrix, method)
+    projector.state_init(3, 5, 67, 86, input_census)
+    projector.run()
+
+    _assert_census_close(simulator, projector)
+
+
+@pytest.mark.parametrize('method', ['convolution', 'direct', 'fft'])
+def test_run_simulation_method(method):
+    pytest.importorskip('pandas')
+    from des_simulator import run_simulation
+    expected = run_simulation(n_days = N_DAYS, doubling_time = 4.5, use_cache = False)
+    actual = run_simulation(n_days = N_DAYS, doubling_time = 4.5, method = method, use_cache = False)
+    assert list(actual.columns) == list(expected.columns)
+    for column in expected.columns:
+        np.testing.assert_allclose(actual[column].to_numpy(), expected[column].to_numpy(), rtol = 1e-9, atol = 1e-9)
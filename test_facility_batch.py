@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from des_simulator import run_simulation
+from facility_batch import run_facility_batch
+
+'''
+run_facility_batch errors reported per facility, and projections against run_simulation
+'''
+
+
+def _census(n_days, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'Date': pd.date_range('2020-03-01', periods = n_days).strftime('%Y-%m-%d'),
+                         'ICU_COVID_Census': rng.integers(1, 20, n_days).astype(float),
+                         'ICU_non_COVID_Census': rng.integers(40, 70, n_days).astype(float),
+                         'Floor_COVID_Census': rng.integers(1, 30, n_days).astype(float),
+                         'Floor_non_COVID_Census': rng.integers(50, 90, n_days).astype(float)})
+
+
+def _census_file(tmp_path, facilities):
+    frames = [census.assign(Facility = facility) for facility, census in facilities.items()]
+    path = tmp_path / 'census.csv'
+    pd.concat(frames).to_csv(path, index = False)
+    return path
+
+
+def _projected(output_path, facility):
+    df_census = pd.read_csv(output_path)
+    return df_census[df_census['Facility'] == facility].drop(columns = 'Facility').reset_index(drop = True)
+
+
+def _assert_matches_run_simulation(actual, **parameters):
+    expected = run_simulation(use_cache = False, **parameters)
+    for column in expected.columns:
+        np.testing.assert_allclose(actual[column].to_numpy(), expected[column].to_numpy(), rtol = 1e-9)
+
+
+@pytest.mark.parametrize('column, value', [('ICU_COVID_Census', 'abc'), ('Floor_non_COVID_Census', -3)])
+def test_invalid_census_values_fail_one_facility(tmp_path, column, value):
+    census_b = _census(6, 1).astype(object)
+    census_b.loc[3, column] = value
+    census_path = _census_file(tmp_path, {'A': _census(5, 0), 'B': census_b})
+    output_path = tmp_path / 'out.csv'
+
+    errors = run_facility_batch(pd.DataFrame({'Facility': ['A', 'B']}), census_path, output_path, n_days = 20)
+    assert list(errors['Facility']) == ['B']
+    assert column in errors['Error'][0] and 'facility B' in errors['Error'][0]
+    _assert_matches_run_simulation(_projected(output_path, 'A'), n_days = 20, df_input_census = _census(5, 0))
+
+
+def test_invalid_parameters_fail_one_facility(tmp_path):
+    df_parameters = pd.DataFrame({'Facility': ['A', 'B', 'C', 'D'],
+                                  'doubling_time': [6.2, 'abc', 4, 5],
+                                  'n_days': [20, 20, None, 0]})
+    output_path = tmp_path / 'out.csv'
+
+    errors = run_facility_batch(df_parameters, None, output_path).set_index('Facility')['Error']
+    assert sorted(errors.index) == ['B', 'C', 'D']
+    assert 'finite numbers' in errors['B']
+    assert 'n_days' in errors['C'] and 'n_days' in errors['D']
+    _assert_matches_run_simulation(_projected(output_path, 'A'), n_days = 20, doubling_time = 6.2)
+
+
+def test_cohort_without_los(tmp_path):
+    # accepted as in run_simulation, its patients stay on the floor for the longest los
+    df_parameters = pd.DataFrame({'Facility': ['A'], 'los_matrix_0_0': [0]})
+    output_path = tmp_path / 'out.csv'
+
+    errors = run_facility_batch(df_parameters, None, output_path, n_days = 30)
+    assert len(errors) == 0
+    _assert_matches_run_simulation(_projected(output_path, 'A'), n_days = 30, los_matrix_0_0 = 0)
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from des_simulator import Batch_DES_Simulator, Convolution_Projector, growth_schedule, project_census
+
+'''
+growth_schedule admissions, and schedules projected by Convolution_Projector against Batch_DES_Simulator
+'''
+
+N_DAYS = 600
+CENSUS_ARRAYS = ['icu_covid_census', 'icu_noncovid_census', 'floor_covid_census', 'floor_noncovid_census']
+
+
+def _piecewise_doubling_time(n_days):
+    # an intervention slowing the growth, then a partial release
+    return np.r_[np.full(200, 6.2), np.full(200, 30.), np.full(n_days - 400, 12.)]
+
+
+def test_constant_growth():
+    schedule = growth_schedule(40, 11, 6.2)
+    assert schedule[0] == 0
+    # the admissions of the original day by day formula
+    days = np.arange(1, 40)
+    np.testing.assert_allclose(schedule[1:], 11 * 2**((days - 1)/6.2) * (2**(1/6.2) - 1), rtol = 1e-12)
+    np.testing.assert_allclose(growth_schedule(40, 11, np.full(40, 6.2)), schedule, rtol = 1e-12)
+
+
+def test_scenario_doubling_times():
+    doubling_time = np.array([np.full(50, 6.2), _piecewise_doubling_time(450)[-50:], np.linspace(3, 20, 50)])
+    starting_total = np.array([[11], [4], [30]])
+    schedule = growth_schedule(50, starting_total, doubling_time)
+    assert schedule.shape == (3, 50)
+    for scenario in range(3):
+        np.testing.assert_allclose(schedule[scenario], growth_schedule(50, starting_total[scenario, 0], doubling_time[scenario]),
+                                   rtol = 1e-12)
+    # the cumulative admissions double once per doubling time
+    cumulative = starting_total + np.cumsum(schedule, axis = 1)
+    np.testing.assert_allclose(np.log2(cumulative[:, 1:] / cumulative[:, :-1]), 1/doubling_time[:, 1:], rtol = 1e-9)
+    with pytest.raises(ValueError):
+        growth_schedule(60, 11, doubling_time)
+
+
+@pytest.mark.parametrize('n_observed', [1, 2, 7])
+def test_observed_admissions(n_observed):
+    observed = np.array([[5., 3, 4, 8, 6, 9, 12], [5., 1, 1, 2, 2, 3, 2]])[:, :n_observed]
+    projected = growth_schedule(30, 11, [[6.2], [9]])
+    schedule = growth_schedule(30, 11, [[6.2], [9]], observed)
+    # day 0 has no admissions, the observed days replace the projection
+    assert np.all(schedule[:, 0] == 0)
+    np.testing.assert_array_equal(schedule[:, 1:n_observed], observed[:, 1:])
+    # the projection keeps its growth from the last observed admissions on
+    level = observed[:, -1] / projected[:, n_observed - 1] if n_observed > 1 else np.ones(2)
+    np.testing.assert_allclose(schedule[:, n_observed:], projected[:, n_observed:] * level[:, np.newaxis], rtol = 1e-12)
+
+
+def _schedules():
+    observed = np.array([0., 2, 3, 3, 5, 8, 7, 11, 14])
+    return {'piecewise': growth_schedule(N_DAYS + 1, 11, _piecewise_doubling_time(N_DAYS + 1)),
+            'observed': growth_schedule(N_DAYS + 1, 11, 9, observed),
+            'scenarios': growth_schedule(N_DAYS + 1, [[11], [3]], [[6.2], [14]], observed),
+            'geometric': growth_schedule(N_DAYS + 1, [[11], [3]], [[6.2], [14]])}
+
+
+@pytest.mark.parametrize('method', ['fft', 'auto'])
+@pytest.mark.parametrize('schedule_name', ['piecewise', 'observed', 'scenarios', 'geometric'])
+def test_projector_schedule_matches_batch_simulator(method, schedule_name):
+    schedule = _schedules()[schedule_name]
+    simulator = Batch_DES_Simulator(N_DAYS, admission_schedule = schedule)
+    simulator.state_init(2, 2, 67, 86)
+    simulator.run()
+    projector = Convolution_Projector(N_DAYS, method = method, admission_schedule = schedule)
+    projector.state_init(2, 2, 67, 86)
+    projector.run()
+    for name in CENSUS_ARRAYS:
+        np.testing.assert_allclose(getattr(projector, name), getattr(simulator, name), rtol = 1e-9)
+
+
+@pytest.mark.parametrize('method', ['fft', 'convolution'])
+def test_project_census_schedule(method):
+    schedule = _schedules()['piecewise']
+    expected = project_census(N_DAYS, admission_schedule = schedule)
+    actual = project_census(N_DAYS, method = method, admission_schedule = schedule)
+    for name in expected.dtype.names:
+        np.testing.assert_allclose(actual[name], expected[name], rtol = 1e-9)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from des_simulator import los_sensitivity, scenario_parameters, scenario_simulator
+
+'''
+los_sensitivity census changes and cap days against Batch_DES_Simulator runs of every perturbed los
+'''
+
+N_DAYS = 80
+
+
+def _des_census(parameters):
+    simulator = scenario_simulator(scenario_parameters(**parameters), N_DAYS, 'des')
+    simulator.run()
+    return simulator.icu_covid_census[0], simulator.floor_covid_census[0]
+
+
+@pytest.mark.parametrize('los_parameters', [{},
+                                            # the -1 perturbation of cell (0, 0) leaves cohort 0 without any los
+                                            {'los_matrix_0_0': 1},
+                                            # a cohort without any los, whose stay follows the longest los
+                                            {'los_matrix_3_1': 0, 'los_matrix_3_2': 0}])
+def test_matches_des_simulator(los_parameters):
+    parameters = dict(los_parameters, floor_capacity = 150)
+    sensitivity = los_sensitivity(n_days = N_DAYS, validate = True, **parameters)
+    np.testing.assert_array_equal(sensitivity.cap_days, sensitivity.discrete_cap_days)
+
+    icu_base, floor_base = _des_census(parameters)
+    for k, perturbation in enumerate(sensitivity.perturbations):
+        for c, (i, j) in enumerate(sensitivity.cells):
+            perturbed = dict(parameters)
+            perturbed['los_matrix_%d_%d' % (i, j)] = scenario_parameters(**parameters)['los_matrix_%d_%d' % (i, j)][0] + perturbation
+            icu, floor = _des_census(perturbed)
+            np.testing.assert_allclose(sensitivity.icu_covid[k, c], icu - icu_base, atol = 1e-6)
+            np.testing.assert_allclose(sensitivity.floor_covid[k, c], floor - floor_base, atol = 1e-6)
+
+
+@pytest.mark.parametrize('parameters', [{}, {'los_matrix_0_0': 1, 'floor_capacity': 150}, {'doubling_time': 4, 'icu_capacity': 60}])
+def test_sensitivity_calculation_analytic(parameters):
+    pytest.importorskip('pandas')
+    from des_simulator import sensitivity_calculation
+    discrete = sensitivity_calculation(use_cache = False, **parameters)
+    analytic = sensitivity_calculation(los_method = 'analytic', use_cache = False, **parameters)
+    assert len(analytic) == len(discrete)
+    for expected, actual in zip(discrete, analytic):
+        np.testing.assert_array_equal(actual.to_numpy(dtype = float), expected.to_numpy(dtype = float))
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from des_simulator import Batch_DES_Simulator, Input_Census, growth_schedule
+from pathway_engine import Pathway_Simulator, legacy_pathways
+
+'''
+Pathway_Simulator over legacy_pathways against Batch_DES_Simulator, on random los matrices and fractions
+'''
+
+N_DAYS = 60
+N_SCENARIOS = 5
+UNITS = ['icu', 'floor']
+
+
+def _random_los(rng):
+    # [cohort, stay], every cohort with at least one nonzero stay, as pathways need
+    los = rng.integers(0, 12, (5, 3))
+    los[:, 1] = np.where(np.all(los == 0, axis = 1), rng.integers(1, 12, 5), los[:, 1])
+    return los
+
+
+def _random_fraction(rng, n_scenarios):
+    fraction = rng.uniform(0.01, 1, (n_scenarios, 5))
+    return fraction / np.sum(fraction, axis = 1, keepdims = True)
+
+
+def _input_census(rng, n_input_days):
+    return Input_Census(np.arange(n_input_days),
+                        rng.integers(1, 20, n_input_days).astype(float), rng.integers(40, 70, n_input_days).astype(float),
+                        rng.integers(1, 30, n_input_days).astype(float), rng.integers(50, 90, n_input_days).astype(float))
+
+
+@pytest.mark.parametrize('n_input_days', [None, 1, 9])
+@pytest.mark.parametrize('scheduled', [False, True])
+@pytest.mark.parametrize('seed', range(4))
+def test_legacy_pathways_match_batch_simulator(n_input_days, scheduled, seed):
+    rng = np.random.default_rng(seed)
+    los_matrix = _random_los(rng)
+    cohort_fraction = _random_fraction(rng, N_SCENARIOS)
+    starting_total = rng.uniform(1, 50, N_SCENARIOS)
+    doubling_time = rng.uniform(2, 20, N_SCENARIOS)
+    input_census = None if n_input_days is None else _input_census(rng, n_input_days)
+    icu_census_covid_0 = rng.uniform(0, 10, N_SCENARIOS)
+    floor_census_covid_0 = rng.uniform(0, 10, N_SCENARIOS)
+    n_total_days = N_DAYS + (1 if n_input_days is None else n_input_days)
+    schedule = None
+    if scheduled:
+        # piecewise growth, continued from the observed admissions
+        piecewise = np.where(np.arange(n_total_days) < 20, doubling_time[:, np.newaxis], 3 * doubling_time[:, np.newaxis])
+        schedule = growth_schedule(n_total_days, starting_total[:, np.newaxis], piecewise, rng.uniform(0, 5, (N_SCENARIOS, 4)))
+
+    simulator = Batch_DES_Simulator(N_DAYS, starting_total, doubling_time, cohort_fraction,
+                                    np.repeat(los_matrix[np.newaxis], N_SCENARIOS, axis = 0), schedule)
+    simulator.state_init(icu_census_covid_0, floor_census_covid_0, 67, 86, input_census)
+    simulator.run()
+
+    pathway_simulator = Pathway_Simulator(N_DAYS, starting_total, doubling_time, legacy_pathways(cohort_fraction[0], los_matrix),
+                                          UNITS, cohort_fraction, schedule)
+    if input_census is None:
+        pathway_simulator.state_init({'icu': icu_census_covid_0, 'floor': floor_census_covid_0})
+    else:
+        pathway_simulator.state_init(observed_census = np.stack([input_census.icu_covid, input_census.floor_covid], axis = -1))
+    pathway_simulator.run()
+
+    np.testing.assert_allclose(pathway_simulator.unit_census('icu'), simulator.icu_covid_census, rtol = 1e-9, atol = 1e-9)
+    np.testing.assert_allclose(pathway_simulator.unit_census('floor'), simulator.floor_covid_census, rtol = 1e-9, atol = 1e-9)
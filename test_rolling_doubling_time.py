@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from des_simulator import COL_CUM_COVID_ADMISSION, rolling_doubling_time
+
+'''
+rolling_doubling_time fits against arrival_fitting and least squares fits of each window
+'''
+
+N_DAYS = 30
+
+
+def _cum_admissions(rng, n_series):
+    # noisy exponential growth, starting below the fit threshold
+    daily = rng.uniform(0.5, 3, (n_series, 1)) * 2**(np.arange(N_DAYS) / rng.uniform(3, 12, (n_series, 1)))
+    return np.cumsum(np.round(daily * rng.uniform(0.7, 1.3, daily.shape)), axis = 1)
+
+
+@pytest.mark.parametrize('window', [5, 7, 10])
+@pytest.mark.parametrize('missing_day', [None, N_DAYS - 3])
+def test_last_window_matches_arrival_fitting(window, missing_day):
+    pd = pytest.importorskip('pandas')
+    from des_simulator import arrival_fitting
+    cum_admissions = _cum_admissions(np.random.default_rng(window), 1)[0]
+    if missing_day is not None:
+        cum_admissions[missing_day] = np.nan
+
+    fit = rolling_doubling_time(cum_admissions, window)
+    df_fitted, _ = arrival_fitting(pd.DataFrame({COL_CUM_COVID_ADMISSION: cum_admissions}), use_past_n_days = window)
+    assert fit['n_points'][-1] == df_fitted.iloc[0, 1]
+    np.testing.assert_allclose(fit['doubling_time'][-1], df_fitted.iloc[1, 1], rtol = 1e-9)
+    np.testing.assert_allclose(fit['first_day_admissions'][-1], df_fitted.iloc[2, 1], rtol = 1e-9)
+
+
+def test_windows_match_least_squares():
+    cum_admissions = _cum_admissions(np.random.default_rng(0), 1)[0]
+    cum_admissions[12] = np.nan
+    fit = rolling_doubling_time(cum_admissions, 7)
+    for day in range(N_DAYS):
+        days = np.arange(max(day - 6, 0), day + 1)
+        days = days[cum_admissions[days] > 4]
+        assert fit['n_points'][day] == len(days)
+        if len(days) < 3:
+            continue
+        (slope, intercept), covariance = np.polyfit(days, np.log2(cum_admissions[days]), 1, cov = True)
+        np.testing.assert_allclose([fit['slope'][day], fit['intercept'][day]], [slope, intercept], rtol = 1e-9)
+        np.testing.assert_allclose([fit['slope_se'][day], fit['intercept_se'][day]], np.sqrt(np.diag(covariance)),
+                                   rtol = 1e-6, atol = 1e-12)
+
+
+def test_series_batch():
+    cum_admissions = _cum_admissions(np.random.default_rng(1), 6)
+    cum_admissions[2, 5:9] = np.nan
+    fit = rolling_doubling_time(cum_admissions, 7)
+    for series in range(len(cum_admissions)):
+        series_fit = rolling_doubling_time(cum_admissions[series], 7)
+        for name, value in fit.items():
+            assert value.shape == cum_admissions.shape
+            np.testing.assert_allclose(value[series], series_fit[name], rtol = 1e-12, atol = 1e-12)
+
+
+def test_too_few_points():
+    # windows of 1, 2 and 3 points above the threshold
+    cum_admissions = np.array([1., 2, 3, 5, 8, 13])
+    fit = rolling_doubling_time(cum_admissions, 3)
+    np.testing.assert_array_equal(fit['n_points'], [0, 0, 0, 1, 2, 3])
+    for name in ['slope', 'intercept', 'doubling_time', 'first_day_admissions']:
+        assert np.all(np.isnan(fit[name][:4])) and np.all(np.isfinite(fit[name][4:]))
+    for name in ['slope_se', 'intercept_se', 'doubling_time_se']:
+        assert np.all(np.isnan(fit[name][:5])) and np.isfinite(fit[name][5])
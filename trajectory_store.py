@@ -0,0 +1,117 @@
+import json
+import os
+
+import numpy as np
+
+'''
+Out-of-core census trajectories of sweeps and ensembles
+a store at path is three files:
+    path.npy: census [column, scenario, day], a memory-mapped npy written a chunk of scenarios at a time
+    path.parameters.npy: structured array of the parameters of each scenario
+    path.json: index with the shape, the column names and free metadata
+slices of a store are views of the mapped files, so reading a few scenarios, days or one column
+loads only those pages, and writing a chunk keeps memory flat whatever the number of scenarios
+'''
+
+# census columns, as the fields of des_simulator.CENSUS_DTYPE
+TRAJECTORY_COLUMNS = ['icu_covid', 'icu_noncovid', 'floor_covid', 'floor_noncovid']
+
+
+def _store_paths(path):
+    # census, parameters and index files of a store
+    base = str(path)[:-len('.npy')] if str(path).endswith('.npy') else str(path)
+    return base + '.npy', base + '.parameters.npy', base + '.json'
+
+
+class Trajectory_Store():
+    '''
+    Memory-mapped census trajectories, opened read only (mode 'r') or for writing (mode 'r+')
+    make a new store with Trajectory_Store.create
+    '''
+    def __init__(self, path, mode = 'r'):
+        census_path, parameters_path, index_path = _store_paths(path)
+        with open(index_path) as index_file:
+            self.index = json.load(index_file)
+        self.path = path
+        self.mode = mode
+        self.columns = self.index['columns']
+        self.n_scenarios = self.index['n_scenarios']
+        self.n_days = self.index['n_days']
+        self.metadata = self.index['metadata']
+        # [column, scenario, day]
+        self.data = np.load(census_path, mmap_mode = mode)
+        self.parameters = np.load(parameters_path, mmap_mode = mode) if os.path.exists(parameters_path) else None
+
+    @classmethod
+    def create(cls, path, n_scenarios, n_days, parameters = None, metadata = None, columns = TRAJECTORY_COLUMNS):
+        '''
+        empty store of n_scenarios trajectories of n_days, opened for writing
+            parameters: dict of parameter name -> one value per scenario
+            metadata: json-ready dict kept in the index
+        '''
+        census_path, parameters_path, index_path = _store_paths(path)
+        data = np.lib.format.open_memmap(census_path, mode = 'w+', dtype = np.float64,
+                                         shape = (len(columns), n_scenarios, n_days))
+        del data
+        if parameters is not None:
+            parameters = dict((name, np.asarray(value)) for name, value in parameters.items())
+            records = np.lib.format.open_memmap(parameters_path, mode = 'w+',
+                                                dtype = [(name, value.dtype) for name, value in parameters.items()],
+                                                shape = (n_scenarios,))
+            for name, value in parameters.items():
+                records[name] = value
+            records.flush()
+            del records
+        elif os.path.exists(parameters_path):
+            os.remove(parameters_path)
+        with open(index_path, 'w') as index_file:
+            json.dump({'n_scenarios': n_scenarios, 'n_days': n_days, 'columns': list(columns),
+                       'metadata': metadata or {}}, index_file, indent = 1)
+        return cls(path, 'r+')
+
+    def write(self, start, *census):
+        '''
+        census of the scenarios from start on, one [scenario, day] array per column in column order
+        '''
+        n_rows = np.shape(census[0])[0]
+        for col_ind, values in enumerate(census):
+            self.data[col_ind, start:start + n_rows] = values
+        return None
+
+    def write_parameters(self, start, parameters):
+        # parameters of the scenarios from start on, dict of parameter name -> one value per scenario
+        for name, value in parameters.items():
+            self.parameters[name][start:start + len(value)] = value
+        return None
+
+    def write_simulator(self, start, simulator):
+        # census arrays of a Batch_DES_Simulator (or any simulator with [scenario, day] census) after run()
+        return self.write(start, simulator.icu_covid_census, simulator.icu_noncovid_census,
+                          simulator.floor_covid_census, simulator.floor_noncovid_census)
+
+    def flush(self):
+        self.data.flush()
+        if self.parameters is not None:
+            self.parameters.flush()
+        return None
+
+    def census(self, column, scenarios = slice(None), days = slice(None)):
+        # [scenario, day] of one column, a view of the file for slices
+        return self.data[self.columns.index(column), scenarios, days]
+
+    def trajectories(self, scenarios = slice(None), days = slice(None)):
+        # [column, scenario, day] of every column
+        return self.data[:, scenarios, days]
+
+    def close(self):
+        if self.mode != 'r':
+            self.flush()
+        self.data = None
+        self.parameters = None
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()